@@ -1,16 +1,59 @@
 from abc import ABCMeta, abstractmethod
+from collections import defaultdict, deque
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+from functools import lru_cache
+from itertools import islice, repeat
+from filters import SeenLines
+from indexes import (build_locate_index, build_trigram_index,
+                     find_locate_index, find_trigram_index,
+                     open_locate_index)
+from matchers import compile_bytes_regex, compile_matcher
+from predicates import compile_expression, Print, RootEntry
+from sorting import DEFAULT_BUFFER_SIZE, sort_lines, SortKey, top_lines
+from watchers import create_watcher, FollowedFile
 import fnmatch
+import grp
+import mmap
 import os
+import pwd
 import re
 import readline
+import stat
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class Applications(metaclass=ABCMeta):
+    # Applications that consume piped input incrementally set this flag and
+    # receive the pipe itself; all others receive the full input as a string.
+    streams_input = False
+
     @abstractmethod
     def exec(self, args, output_queue, input_data,
              input_redirection, output_redirection):
         pass
 
+    def input_lines(self, input_data):
+        if isinstance(input_data, str):
+            return iter(input_data.splitlines())
+        return (line[:-1] if line.endswith('\n') else line
+                for line in input_data)
+
+    def parse_size(self, value, option, command):
+        # Sizes are given in bytes, optionally with a K, M or G suffix.
+        units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+        unit = units.get(value[-1:].upper(), 1)
+        number = value[:-1] if unit > 1 else value
+        if not number.isdigit() or int(number) == 0:
+            raise ValueError(f"Invalid value '{value}' for '{option}' "
+                             f"in {command} command")
+        return int(number) * unit
+
     def handle_exception(self, e, custom_message):
         raise Exception(f"{custom_message}: {str(e)}")
 
@@ -51,23 +94,127 @@ class Echo(Applications):
 
 
 class Ls(Applications):
+    flags = {'l': 'long', 'a': 'all', 'R': 'recursive', 'S': 'by_size',
+             't': 'by_time', '1': 'one_per_line'}
+    # Modification times older than this, in seconds, are shown with the
+    # year instead of the time of day.
+    recent = 180 * 24 * 60 * 60
+
     def exec(self, args, output_queue, input_data,
              input_redirection, output_redirection):
-        if len(args) > 1:
-            raise ValueError("Expected format: ls or ls [PATH]")
-        ls_dir = args[0] if args else os.getcwd()
+        options, path = self.parse_options(args)
+        ls_dir = path if path is not None else '.'
         try:
-            lst_dir = os.listdir(ls_dir)
-            for file in lst_dir:
-                if not file.startswith("."):
-                    output_queue.append(file + "\n")
+            if not os.path.isdir(ls_dir) and os.path.lexists(ls_dir):
+                entry = RootEntry(ls_dir)
+                output_queue.append(self.format_entry(entry, options,
+                                                      ls_dir))
+            else:
+                self.list_directories(ls_dir, options, output_queue)
         except FileNotFoundError as e:
-            dir_name = args[0] if args else "current directory"
+            dir_name = path if path is not None else "current directory"
             self.handle_io_exception(e, "Listing directory contents", dir_name)
         except PermissionError as e:
-            dir_name = args[0] if args else "current directory"
+            dir_name = path if path is not None else "current directory"
             self.handle_io_exception(e, "Permission Error", dir_name)
 
+    def parse_options(self, args):
+        options = dict.fromkeys(self.flags.values(), False)
+        path = None
+        for arg in args:
+            if (len(arg) > 1 and arg.startswith('-')
+                    and all(flag in self.flags for flag in arg[1:])):
+                for flag in arg[1:]:
+                    options[self.flags[flag]] = True
+            elif path is None:
+                path = arg
+            else:
+                raise ValueError("Expected format: ls [-laRSt1] [PATH]")
+        return options, path
+
+    def list_directories(self, root, options, output_queue):
+        # Entries are output as they are read from each directory, and
+        # with -R each directory is followed by its subdirectories, so
+        # only the paths of subdirectories still to list are kept.
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = self.directory_entries(directory, options)
+            except OSError:
+                if directory == root:
+                    raise
+                continue
+            if options['recursive']:
+                separator = "\n" if directory != root else ""
+                output_queue.append(f"{separator}{directory}:\n")
+            subdirectories = []
+            for entry in entries:
+                output_queue.append(self.format_entry(entry, options))
+                if (options['recursive']
+                        and entry.is_dir(follow_symlinks=False)):
+                    subdirectories.append(entry.path)
+            stack.extend(reversed(subdirectories))
+
+    def directory_entries(self, directory, options):
+        # Opening the directory here, rather than in the generator, makes
+        # errors surface before anything is output for it.
+        entries = self.visible_entries(os.scandir(directory), options)
+        if options['by_size'] or options['by_time']:
+            # The key of each entry is computed once, from the stat data
+            # the entry caches and the long format reuses.
+            entries = sorted(entries, key=self.sort_key(options))
+        return entries
+
+    @staticmethod
+    def visible_entries(scanned, options):
+        with scanned:
+            for entry in scanned:
+                if options['all'] or not entry.name.startswith('.'):
+                    yield entry
+
+    @staticmethod
+    def sort_key(options):
+        # Largest or newest first; ties are ordered by name.
+        if options['by_time']:
+            return lambda entry: (
+                -entry.stat(follow_symlinks=False).st_mtime_ns, entry.name)
+        return lambda entry: (
+            -entry.stat(follow_symlinks=False).st_size, entry.name)
+
+    def format_entry(self, entry, options, name=None):
+        name = entry.name if name is None else name
+        if not options['long']:
+            return name + "\n"
+        info = entry.stat(follow_symlinks=False)
+        if time.time() - info.st_mtime < self.recent:
+            mtime = time.strftime("%b %d %H:%M", time.localtime(info.st_mtime))
+        else:
+            mtime = time.strftime("%b %d  %Y", time.localtime(info.st_mtime))
+        line = (f"{stat.filemode(info.st_mode)} {info.st_nlink:>3} "
+                f"{self.user_name(info.st_uid):<8} "
+                f"{self.group_name(info.st_gid):<8} "
+                f"{info.st_size:>8} {mtime} {name}")
+        if stat.S_ISLNK(info.st_mode):
+            line += f" -> {os.readlink(entry.path)}"
+        return line + "\n"
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def user_name(uid):
+        try:
+            return pwd.getpwuid(uid).pw_name
+        except KeyError:
+            return str(uid)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def group_name(gid):
+        try:
+            return grp.getgrgid(gid).gr_name
+        except KeyError:
+            return str(gid)
+
 
 class Cat(Applications):
     def exec(self, args, output_queue, input_data,
@@ -87,6 +234,8 @@ class Cat(Applications):
 
 
 class Head(Applications):
+    streams_input = True
+
     def exec(self, args, output_queue, input_data,
              input_redirection, output_redirection):
         num_lines = 10
@@ -112,9 +261,12 @@ class Head(Applications):
                     for line in lines[:num_lines]:
                         output_queue.append(line)
             elif input_data:
-                lines = input_data.splitlines()
-                num_lines = min(num_lines, len(lines))
-                for line in lines[:num_lines]:
+                lines = self.input_lines(input_data)
+                if num_lines >= 0:
+                    lines = islice(lines, num_lines)
+                else:
+                    lines = list(lines)[:num_lines]
+                for line in lines:
                     line = line + '\n'
                     output_queue.append(line)
             elif args:
@@ -136,16 +288,82 @@ class Tail(Applications):
     def exec(self, args, output_queue, input_data,
              input_redirection, output_redirection):
         num_lines = 10
-        if args and args[0] == "-n":
+        follow = follow_name = False
+        sleep_interval = 1.0
+        files = []
+        args = list(args)
+        while args:
+            arg = args.pop(0)
+            if arg == "-n":
+                try:
+                    num_lines = int(args.pop(0))
+                except IndexError:
+                    raise ValueError("Missing argument after -n option")
+                except ValueError:
+                    raise ValueError("Invalid argument after -n option")
+            elif arg in ("-f", "-F"):
+                follow = True
+                follow_name = follow_name or arg == "-F"
+            elif arg == "-s":
+                try:
+                    sleep_interval = float(args.pop(0))
+                except IndexError:
+                    raise ValueError("Missing argument after -s option")
+                except ValueError:
+                    raise ValueError("Invalid argument after -s option")
+            else:
+                files.append(arg)
+
+        if follow and (files or input_redirection):
+            self.follow(files or [input_redirection], num_lines,
+                        follow_name, sleep_interval, output_queue)
+        else:
+            self.process_lines(files, num_lines, output_queue,
+                               input_data, input_redirection)
+
+    def follow(self, file_names, num_lines, follow_name,
+               sleep_interval, output_queue):
+        followed = []
+        for file_name in file_names:
             try:
-                num_lines = int(args[1])
-                args = args[2:]
-            except IndexError:
-                raise ValueError("Missing argument after -n option")
-            except ValueError:
-                raise ValueError("Invalid argument after -n option")
-        self.process_lines(args, num_lines, output_queue,
-                           input_data, input_redirection)
+                followed.append(FollowedFile(file_name, follow_name))
+            except FileNotFoundError as e:
+                self.handle_io_exception(e, "Reading file", file_name)
+            except IOError as e:
+                self.handle_io_exception(e, "IO Error in File", file_name)
+
+        watcher = create_watcher(file_names, sleep_interval)
+        last_shown = None
+        try:
+            for tailed in followed:
+                last_shown = self.output_followed(
+                    tailed, tailed.read_last_lines(num_lines),
+                    last_shown, len(followed) > 1, output_queue, True)
+            while not getattr(output_queue, 'broken', False):
+                watcher.wait()
+                for tailed in followed:
+                    text = tailed.read_new()
+                    if text:
+                        last_shown = self.output_followed(
+                            tailed, text, last_shown,
+                            len(followed) > 1, output_queue)
+                        watcher.reset()
+        except (BrokenPipeError, KeyboardInterrupt):
+            pass
+        finally:
+            watcher.close()
+            for tailed in followed:
+                tailed.close()
+
+    def output_followed(self, tailed, text, last_shown, show_headers,
+                        output_queue, always_show_header=False):
+        if show_headers and (tailed is not last_shown
+                             or always_show_header):
+            separator = "" if last_shown is None else "\n"
+            output_queue.append(f"{separator}==> {tailed.path} <==\n")
+        if text:
+            output_queue.append(text)
+        return tailed
 
     def process_lines(self, args, num_lines, output_queue,
                       input_data, input_redirection):
@@ -181,197 +399,774 @@ class Tail(Applications):
 
 
 class Grep(Applications):
-    def process_file(self, file, pattern, output_queue, is_multiple_files):
+    streams_input = True
+    # Regular files at least this large are memory-mapped and scanned in
+    # line-aligned chunks by a pool of worker processes.
+    mmap_threshold = 64 * 1024 * 1024
+    # Recursive searches skip files with a NUL byte in their first block.
+    binary_sniff_size = 8192
+    flags = {'F': 'fixed', 'i': 'ignore_case',
+             'v': 'invert', 'w': 'whole_word'}
+    switches = {'r': 'recursive', 'q': 'quiet',
+                'l': 'files_with_matches', 'c': 'count'}
+    glob_options = ('include', 'exclude', 'exclude-dir')
+    counts = {'-j': ('jobs',), '-m': ('max_count',),
+              '-A': ('after_context',), '-B': ('before_context',),
+              '-C': ('before_context', 'after_context')}
+
+    def matching_lines(self, file, matches, options, is_multiple_files):
         try:
-            with open(file, "r") as f:
-                lines = f.readlines()
-                for line in lines:
-                    if re.search(pattern, line):
-                        output_queue.append(f"{file}:{line}" if
-                                            is_multiple_files else line)
+            if options['recursive'] and self.is_binary(file):
+                return
+            # Bytes that are not valid UTF-8 are replaced rather than
+            # ending the search.
+            with open(file, "r", errors='replace') as f:
+                yield from self.select_lines(
+                    f, matches, options, file,
+                    f"{file}:" if is_multiple_files else "")
         except FileNotFoundError as e:
             self.handle_io_exception(e, "Reading", file)
+        except IOError as e:
+            # A recursive search goes on past files it cannot read.
+            if options['recursive']:
+                return
+            self.handle_io_exception(e, "IO Error in file", file)
+
+    def select_lines(self, lines, matches, options, label, prefix):
+        # Stops reading as soon as the requested output is complete: at the
+        # first match for -l (and -q), or after -m NUM matches.
+        limit = options['max_count']
+        count = 0
+        if ((options['before_context'] or options['after_context'])
+                and not (options['count'] or options['files_with_matches'])):
+            yield from self.select_with_context(lines, matches, options,
+                                                prefix)
+        elif limit != 0:
+            for line in lines:
+                if not matches(line):
+                    continue
+                if options['files_with_matches']:
+                    yield f"{label}\n"
+                    return
+                count += 1
+                if not options['count']:
+                    yield prefix + line
+                if count == limit:
+                    break
+        if options['count'] and not options['files_with_matches']:
+            yield f"{prefix}{count}\n"
+
+    def select_with_context(self, lines, matches, options, prefix):
+        # Only the last -B lines are kept, in a bounded deque, so memory
+        # use does not depend on the size of the input.
+        before = deque(maxlen=options['before_context'])
+        context_prefix = prefix[:-1] + "-" if prefix else ""
+        limit = options['max_count']
+        count = after = 0
+        last_shown = None
+        for number, line in enumerate(lines):
+            if (limit is None or count < limit) and matches(line):
+                first = number - len(before)
+                if last_shown is not None and first > last_shown + 1:
+                    yield "--\n"
+                for context_line in before:
+                    yield context_prefix + context_line
+                before.clear()
+                yield prefix + line
+                count += 1
+                after = options['after_context']
+                last_shown = number
+            elif after:
+                yield context_prefix + line
+                after -= 1
+                last_shown = number
+            elif limit is not None and count >= limit:
+                return
+            else:
+                before.append(line)
+
+    def is_binary(self, file):
+        with open(file, "rb") as f:
+            return b'\0' in f.read(self.binary_sniff_size)
+
+    @classmethod
+    def search_file(cls, file, patterns, options, is_multiple_files):
+        # Runs in worker processes for --processes, so it must not depend
+        # on the instance (whose exec may be wrapped, as for _grep).
+        grep = cls()
+        matches = compile_matcher(patterns, **grep.matcher_options(options))
+        return list(grep.matching_lines(file, matches, options,
+                                        is_multiple_files))
+
+    def matcher_options(self, options):
+        return {name: options[name] for name in self.flags.values()}
+
+    def process_files(self, files, patterns, options, output_queue,
+                      is_multiple_files):
+        if options['jobs'] > 1 and is_multiple_files:
+            pool_class = (ProcessPoolExecutor if options['processes']
+                          else ThreadPoolExecutor)
+            with pool_class(max_workers=options['jobs']) as pool:
+                # Submit files as they are produced, keeping a bounded
+                # window of pending searches so that output stays in file
+                # order without waiting for the whole list of files.
+                pending = deque()
+                for file in files:
+                    pending.append(pool.submit(self.search_file, file,
+                                               patterns, options, True))
+                    if len(pending) > 4 * options['jobs']:
+                        output_queue.extend(pending.popleft().result())
+                while pending:
+                    output_queue.extend(pending.popleft().result())
+            return
+        matches = compile_matcher(patterns, **self.matcher_options(options))
+        for file in files:
+            if self.is_large_file(file, options):
+                # As in matching_lines, a recursive search skips binary
+                # files and goes on past files it cannot read.
+                try:
+                    if not (options['recursive'] and self.is_binary(file)):
+                        self.process_large_file(file, patterns, options,
+                                                is_multiple_files,
+                                                output_queue)
+                except IOError:
+                    if not options['recursive']:
+                        raise
+                continue
+            selected = self.matching_lines(file, matches, options,
+                                           is_multiple_files)
+            if options['quiet']:
+                if next(selected, None) is not None:
+                    return
+            else:
+                output_queue.extend(selected)
+
+    def indexed_candidates(self, files, patterns, options):
+        # Files covered by an up-to-date trigram index (see the index
+        # application) are skipped when the index rules out a match.
+        if options['invert'] or options['count']:
+            yield from files
+            return
+        indexes, candidates = {}, {}
+        for file in files:
+            path = os.path.abspath(file)
+            index = find_trigram_index(os.path.dirname(path), indexes)
+            if index is None:
+                yield file
+                continue
+            if index.root not in candidates:
+                candidates[index.root] = index.candidates(
+                    patterns, options['fixed'], options['ignore_case'])
+            relative_path = os.path.relpath(path, index.root)
+            try:
+                current = index.covers(relative_path, os.stat(path))
+            except OSError:
+                current = False
+            if (not current or candidates[index.root] is None
+                    or relative_path in candidates[index.root]):
+                yield file
+
+    def walk(self, paths, options):
+        include = self.compile_globs(options['include'])
+        exclude = self.compile_globs(options['exclude'])
+        exclude_dir = self.compile_globs(options['exclude-dir'])
+        for path in paths:
+            if not os.path.isdir(path):
+                yield path
+                continue
+            directories = [path]
+            while directories:
+                directory = directories.pop()
+                try:
+                    with os.scandir(directory) as it:
+                        entries = sorted(it, key=lambda entry: entry.name)
+                except OSError as e:
+                    # As with find, unreadable subdirectories are skipped.
+                    if directory != path:
+                        continue
+                    if isinstance(e, PermissionError):
+                        self.handle_io_exception(e, "Permission Error",
+                                                 directory)
+                    raise
+                subdirectories = []
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not (exclude_dir and exclude_dir(entry.name)):
+                            subdirectories.append(entry.path)
+                    elif (entry.is_file()
+                          and not (include and not include(entry.name))
+                          and not (exclude and exclude(entry.name))):
+                        yield entry.path
+                directories.extend(reversed(subdirectories))
+
+    def compile_globs(self, globs):
+        if not globs:
+            return None
+        return re.compile("|".join(fnmatch.translate(glob)
+                                   for glob in globs)).match
+
+    def is_large_file(self, file, options):
+        try:
+            return (not (options['invert'] or options['count']
+                         or options['files_with_matches']
+                         or options['max_count'] is not None
+                         or options['before_context']
+                         or options['after_context'])
+                    and os.path.isfile(file)
+                    and os.path.getsize(file) >= max(self.mmap_threshold,
+                                                     1))
+        except OSError:
+            return False
+
+    def process_large_file(self, file, patterns, options,
+                           is_multiple_files, output_queue):
+        matcher_options = self.matcher_options(options)
+        regex_options = dict(matcher_options)
+        del regex_options['invert']
+        if compile_bytes_regex(patterns, **regex_options) is None:
+            matches = compile_matcher(patterns, **matcher_options)
+            output_queue.extend(self.matching_lines(file, matches, options,
+                                                    is_multiple_files))
+            return
+        workers = (options['jobs'] if options['jobs'] > 1
+                   else os.cpu_count() or 1)
+        chunks = self.split_chunks(file, workers)
+        if len(chunks) == 1:
+            output_queue.extend(self.search_chunk(
+                file, *chunks[0], patterns, matcher_options,
+                is_multiple_files))
+            return
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(self.search_chunk, repeat(file),
+                               *zip(*chunks), repeat(patterns),
+                               repeat(matcher_options),
+                               repeat(is_multiple_files))
+            for lines in results:
+                output_queue.extend(lines)
+
+    def split_chunks(self, file, count):
+        try:
+            with open(file, "rb") as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                size = len(mm)
+                boundaries = [0]
+                for i in range(1, count):
+                    newline = mm.find(b'\n', max(size * i // count,
+                                                 boundaries[-1]))
+                    if newline == -1:
+                        break
+                    if newline + 1 < size:
+                        boundaries.append(newline + 1)
+                boundaries.append(size)
         except IOError as e:
             self.handle_io_exception(e, "IO Error in file", file)
+        return list(zip(boundaries, boundaries[1:]))
+
+    @staticmethod
+    def search_chunk(file, start, end, patterns, matcher_options,
+                     is_multiple_files):
+        # Runs in worker processes, so it only takes picklable arguments.
+        regex_options = dict(matcher_options)
+        del regex_options['invert']
+        search = compile_bytes_regex(patterns, **regex_options).search
+        matches = compile_matcher(patterns, **matcher_options)
+        prefix = f"{file}:" if is_multiple_files else ""
+        lines = []
+        with open(file, "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            position = start
+            while position < end:
+                found = search(mm, position, end)
+                # An empty match at the end of the chunk is not a line.
+                if found is None or found.start() >= end:
+                    break
+                line_start = mm.rfind(b'\n', start, found.start()) + 1
+                line_start = max(line_start, start)
+                line_end = mm.find(b'\n', found.start(), end)
+                line_end = end if line_end == -1 else line_end + 1
+                line = mm[line_start:line_end].decode('utf-8', 'replace')
+                if matches(line):
+                    lines.append(prefix + line)
+                position = line_end
+        return lines
+
+    def parse_options(self, args):
+        options = dict.fromkeys(self.flags.values(), False)
+        options.update(dict.fromkeys(self.switches.values(), False))
+        options.update({name: [] for name in self.glob_options})
+        options.update(jobs=1, processes=False, max_count=None,
+                       before_context=0, after_context=0)
+        patterns = None
+        args = list(args)
+        while args and args[0].startswith('-') and len(args[0]) > 1:
+            arg = args.pop(0)
+            if arg == '--':
+                break
+            if arg.startswith('--'):
+                self.parse_long_option(arg, args, options)
+                continue
+            for position, flag in enumerate(arg[1:], 2):
+                option = f"-{flag}"
+                if option in ('-e', '-f') or option in self.counts:
+                    # The value is the rest of the word (-A1) or the next
+                    # argument (-A 1).
+                    value = arg[position:]
+                    if not value:
+                        if not args:
+                            raise ValueError(
+                                f"Missing argument after {option} option")
+                        value = args.pop(0)
+                    patterns = self.parse_value(option, value, options,
+                                                patterns)
+                    break
+                if flag in self.flags:
+                    options[self.flags[flag]] = True
+                elif flag in self.switches:
+                    options[self.switches[flag]] = True
+                else:
+                    raise ValueError(f"Unknown grep option: -{flag}")
+        return options, patterns, args
+
+    def parse_value(self, option, value, options, patterns):
+        if option in self.counts:
+            for name in self.counts[option]:
+                options[name] = self.parse_count(option, value)
+            return patterns
+        patterns = patterns or []
+        if option == '-e':
+            patterns.append(value)
+        else:
+            patterns.extend(self.read_patterns(value))
+        return patterns
+
+    def parse_long_option(self, arg, args, options):
+        name, has_value, value = arg[2:].partition('=')
+        if name == 'processes' and not has_value:
+            options['processes'] = True
+        elif name in self.glob_options:
+            # A quoted value such as --include='*.log' reaches us as two
+            # arguments, so an empty value is taken from the next one.
+            if not value:
+                if not args:
+                    raise ValueError(f"Missing argument after {arg} option")
+                value = args.pop(0)
+            options[name].append(value)
+        else:
+            raise ValueError(f"Unknown grep option: {arg}")
+
+    def parse_count(self, option, value):
+        try:
+            count = int(value)
+        except ValueError:
+            raise ValueError(f"Invalid argument after {option} option")
+        if count < 0:
+            raise ValueError(f"Invalid argument after {option} option")
+        return count
+
+    def read_patterns(self, file_name):
+        try:
+            with open(file_name, "r") as f:
+                return f.read().splitlines()
+        except FileNotFoundError as e:
+            self.handle_io_exception(e, "Reading patterns", file_name)
+        except IOError as e:
+            self.handle_io_exception(e, "IO Error in file", file_name)
 
     def exec(self, args, output_queue, input_data,
              input_redirection, output_redirection):
-        if len(args) < 1:
-            raise ValueError("Expected format: grep PATTERN [FILE]...")
-
-        pattern = args[0]
-        files = args[1:] if len(args) > 1 else []
-        if os.path.isfile(pattern):
-            raise ValueError("Pattern required for first command, not a file")
-        if files:
-            for file in files:
-                self.process_file(file, pattern, output_queue, len(files) > 1)
+        options, patterns, args = self.parse_options(args)
+        if patterns is None:
+            if len(args) < 1:
+                raise ValueError("Expected format: grep [OPTIONS] PATTERN "
+                                 "[FILE]...")
+            if os.path.isfile(args[0]):
+                raise ValueError("Pattern required for first command, "
+                                 "not a file")
+            patterns, args = [args[0]], args[1:]
+
+        files = args
+        patterns = tuple(patterns)
+        if options['quiet']:
+            # -q only has to find one match, so it behaves like -l with the
+            # output discarded and stops at the first file that matches.
+            options = dict(options, files_with_matches=True, jobs=1)
+        if options['recursive']:
+            self.process_files(
+                self.indexed_candidates(self.walk(files or ["."], options),
+                                        patterns, options),
+                patterns, options, output_queue, True)
+        elif files:
+            self.process_files(
+                self.indexed_candidates(files, patterns, options),
+                patterns, options, output_queue, len(files) > 1)
         elif input_data:
-            for line in input_data.splitlines():
-                if re.search(pattern, line):
-                    line = line + '\n'
-                    output_queue.append(line)
+            matches = compile_matcher(patterns,
+                                      **self.matcher_options(options))
+            lines = (line + '\n' for line in self.input_lines(input_data))
+            selected = self.select_lines(lines, matches, options,
+                                         "(standard input)", "")
+            if options['quiet']:
+                next(selected, None)
+            else:
+                output_queue.extend(selected)
         else:
             raise ValueError("No input data or file provided for grep command")
 
 
 class Cut(Applications):
+    streams_input = True
+    fixed_width_threshold = 1024 * 1024
+    fixed_width_block = 65536
+
     def exec(self, args, output_queue, input_data,
              input_redirection, output_redirection):
-        if not args or args[0] != '-b':
-            raise ValueError("Expected '-b' argument in cut command")
-
-        byte_ranges = []
-        parts = args[1].split(',')
-
-        for part in parts:
-            if part.startswith('-'):
-                # Handle negative ranges
-                start = 0
-                end = int(part[1:])
-            elif part.endswith('-'):
-                # Handle negative ranges at the end
-                start = int(part[:-1]) - 1
-                end = len((self.get_input_lines(args,
-                                                input_data,
-                                                input_redirection))[0])
-            elif '-' in part:
-                start, end = part.split('-')
-                start = int(start) - 1
-                end = int(end) if end else None
+        options, file_name = self.parse_options(args)
+        if file_name is None:
+            file_name = input_redirection
+
+        if options['bytes'] is not None:
+            slices = self.parse_ranges(options['bytes'], 'byte')
+            done = 0 if input_data else self.cut_fixed_width(
+                file_name, slices, options['fixed_width'], output_queue)
+            for line in self.input_byte_lines(file_name, input_data, done):
+                output_queue.append(self.process_line(line, slices))
+            return
+
+        slices = self.parse_ranges(options['fields'], 'field')
+        delimiter = options['delimiter'].encode('utf-8')
+        output_delimiter = (delimiter if options['output_delimiter'] is None
+                            else options['output_delimiter'].encode('utf-8'))
+        # Only the fields up to the highest requested one are split off;
+        # the rest of the line stays in one piece.
+        max_split = slices[-1].stop
+        for line in self.input_byte_lines(file_name, input_data):
+            output_queue.append(self.process_fields(
+                line, slices, delimiter, output_delimiter, max_split))
+
+    def parse_options(self, args):
+        options = {'bytes': None, 'fields': None, 'delimiter': '\t',
+                   'output_delimiter': None, 'fixed_width': False}
+        short_options = {'-b': 'bytes', '-f': 'fields', '-d': 'delimiter'}
+        file_name = None
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if arg in short_options:
+                if i + 1 >= len(args):
+                    raise ValueError(f"Expected a value after '{arg}' "
+                                     "in cut command")
+                options[short_options[arg]] = args[i + 1]
+                i += 1
+            elif arg == '--fixed-width':
+                options['fixed_width'] = True
+            elif arg.startswith('--output-delimiter'):
+                value = arg[len('--output-delimiter'):]
+                if value in ('', '=') and i + 1 < len(args):
+                    value = '=' + args[i + 1]
+                    i += 1
+                if not value.startswith('='):
+                    raise ValueError(f"Unknown option '{arg}' in cut command")
+                options['output_delimiter'] = value[1:]
+            elif file_name is None:
+                file_name = arg
             else:
-                byte = int(part) - 1
-                start, end = byte, byte + 1
-
-            # Check for and merge overlapping ranges
-            merged = False
-            if end is None:
-                end = len(self.get_input_lines(args,
-                                               input_data, input_redirection))
-
-            for i, (existing_start, existing_end) in enumerate(byte_ranges):
-                if (start <= existing_end and end >=
-                    existing_start) or (existing_start
-                                        <= end and existing_end >= start):
-                    start = min(start, existing_start)
-                    end = max(end, existing_end)
-                    byte_ranges[i] = (start, end)
-                    merged = True
-                    break
-
-            if not merged:
-                byte_ranges.append((start, end))
-
-        input_lines = self.get_input_lines(args, input_data, input_redirection)
-
-        for line in input_lines:
-            line_output = self.process_line(line, byte_ranges)
-            output_queue.append(line_output + '\n')
-
-    def get_input_lines(self, args, input_data, input_redirection):
-        try:
-            if input_data:
-                input_lines = input_data.splitlines()
+                raise ValueError("Too many arguments in cut command")
+            i += 1
+
+        if (options['bytes'] is None) == (options['fields'] is None):
+            raise ValueError("Expected exactly one of '-b' or '-f' "
+                             "in cut command")
+        if options['fields'] is None and (
+                options['delimiter'] != '\t'
+                or options['output_delimiter'] is not None):
+            raise ValueError("A delimiter may only be given with '-f' "
+                             "in cut command")
+        if options['fixed_width'] and options['bytes'] is None:
+            raise ValueError("'--fixed-width' may only be used with '-b' "
+                             "in cut command")
+        if options['fixed_width'] and numpy is None:
+            raise ValueError("'--fixed-width' requires NumPy "
+                             "in cut command")
+        if len(options['delimiter']) != 1:
+            raise ValueError("The delimiter must be a single character "
+                             "in cut command")
+        return options, file_name
+
+    def parse_ranges(self, range_list, unit):
+        # Ranges are sorted and merged once, so each line is cut with a
+        # fixed list of non-overlapping slices in increasing order.
+        ranges = []
+        for part in range_list.split(','):
+            try:
+                if part.startswith('-'):
+                    start, end = 1, int(part[1:])
+                elif part.endswith('-'):
+                    start, end = int(part[:-1]), None
+                elif '-' in part:
+                    start, end = (int(bound) for bound in part.split('-'))
+                else:
+                    start = end = int(part)
+            except ValueError:
+                raise ValueError(f"Invalid {unit} range '{part}' "
+                                 "in cut command")
+            if start < 1 or (end is not None and end < start):
+                raise ValueError(f"Invalid {unit} range '{part}' "
+                                 "in cut command")
+            ranges.append((start - 1, end))
+
+        ranges.sort(key=lambda item: item[0])
+        merged = [ranges[0]]
+        for start, end in ranges[1:]:
+            last_start, last_end = merged[-1]
+            if last_end is None or start <= last_end:
+                if last_end is not None and (end is None or end > last_end):
+                    merged[-1] = (last_start, end)
             else:
-                file_to_read = args[-1] if args else input_redirection
-                if file_to_read is None:
-                    raise ValueError("No input data provided for Cut command.")
-                with open(file_to_read, 'r') as file:
-                    input_lines = [line.rstrip('\n') for
-                                   line in file.readlines()]
-            return input_lines
+                merged.append((start, end))
+        return [slice(start, end) for start, end in merged]
+
+    def input_byte_lines(self, file_name, input_data, start=0):
+        if input_data:
+            for line in self.input_lines(input_data):
+                yield line.encode('utf-8')
+            return
+        if file_name is None:
+            raise ValueError("No input data provided for Cut command.")
+        try:
+            with open(file_name, 'rb') as file:
+                file.seek(start)
+                for line in file:
+                    yield line[:-1] if line.endswith(b'\n') else line
         except IOError as e:
-            self.handle_io_exception(e, "Reading file", file_to_read)
+            self.handle_io_exception(e, "Reading file", file_name)
 
-    def process_line(self, line, byte_ranges):
-        line_output = ''
-        for start, end in byte_ranges:
-            if start < len(line):
-                if end is None or end > len(line):
-                    end = len(line)
-                partial_output = line[start:end]
-                if partial_output:
-                    line_output += partial_output
-        return line_output
+    def cut_fixed_width(self, file_name, slices, fixed_width, output_queue):
+        """Cut a file whose lines all have the same length as a 2-D byte
+        array, extracting the requested columns of a block of lines with a
+        single indexing operation. Return the number of bytes cut this way;
+        when the file does not qualify, the rest of it has to be cut line
+        by line.
+        """
+        if numpy is None or file_name is None:
+            return 0
+        try:
+            size = os.path.getsize(file_name)
+            if size == 0 or (size < self.fixed_width_threshold
+                             and not fixed_width):
+                return 0
+            with open(file_name, 'rb') as file:
+                width = len(file.readline())
+            records = numpy.memmap(file_name, dtype=numpy.uint8, mode='r')
+        except IOError as e:
+            self.handle_io_exception(e, "Reading file", file_name)
+        if size % width or records[width - 1] != ord('\n'):
+            return self.not_fixed_width(file_name, fixed_width, 0)
+        records = records.reshape(-1, width)
+
+        columns = numpy.concatenate(
+            [numpy.arange(width - 1)[part] for part in slices]
+            + [numpy.array([width - 1])])
+        for start in range(0, len(records), self.fixed_width_block):
+            rows = records[start:start + self.fixed_width_block]
+            # Every row must hold exactly one newline, at its end. Checking
+            # one block at a time keeps the memory used independent of the
+            # size of the file.
+            if not ((rows[:, -1] == ord('\n')).all()
+                    and numpy.count_nonzero(rows == ord('\n'))
+                    == len(rows)):
+                return self.not_fixed_width(file_name, fixed_width,
+                                            start * width)
+            output_queue.append(rows[:, columns].tobytes().decode(
+                'utf-8', 'replace'))
+        return size
+
+    def not_fixed_width(self, file_name, fixed_width, done):
+        if fixed_width:
+            raise ValueError(f"'{file_name}' does not have lines of equal "
+                             "length in cut command")
+        return done
+
+    def process_fields(self, line, slices, delimiter, output_delimiter,
+                       max_split):
+        if delimiter not in line:
+            return line.decode('utf-8', 'replace') + '\n'
+        if max_split is None:
+            fields = line.split(delimiter)
+        else:
+            fields = line.split(delimiter, max_split)
+        selected = []
+        for part in slices:
+            selected.extend(fields[part])
+        return output_delimiter.join(selected).decode('utf-8',
+                                                      'replace') + '\n'
+
+    def process_line(self, line, slices):
+        if len(slices) == 1:
+            line_output = line[slices[0]]
+        else:
+            line_output = b''.join([line[part] for part in slices])
+        return line_output.decode('utf-8', 'replace') + '\n'
 
 
 class Find(Applications):
+    max_workers = 8
+    exec_batch_size = 1024
 
     def exec(self, args, output_queue, input_data,
              input_redirection, output_redirection):
+        sort_output = '--sorted' in args
+        args = [arg for arg in args if arg != '--sorted']
+        path = "."
         try:
-            if len(args) not in (2, 3):
-                raise ValueError("Expected Format:find [PATH] -name [PATTERN]")
-
-            if "-name" not in args:
-                raise ValueError("Expected '-name' in the command")
-
-            path = args[0] if len(args) == 3 else "."
-            pattern = args[-1]
-
-            if len(args) == 3 and not os.path.isdir(path):
-                raise ValueError(f"The specified path '{path}' is not valid.")
-
-            if pattern is None or pattern.strip() == '':
-                raise ValueError("A search pattern must be provided.")
-
-            matches = self.find_files(path, pattern)
-            for match in matches:
-                output_queue.append(match + "\n")
+            if not args:
+                raise ValueError("Expected Format:find [PATH] [EXPRESSION]")
+
+            if not args[0].startswith('-') and args[0] not in ('(', '!'):
+                path = args.pop(0)
+                if not os.path.isdir(path):
+                    raise ValueError(
+                        f"The specified path '{path}' is not valid.")
+
+            expression = compile_expression(args)
+            batches = defaultdict(list)
+            for match, actions in self.find_files(path, expression,
+                                                  sort_output):
+                for action in actions:
+                    if isinstance(action, Print):
+                        output_queue.append(match + "\n")
+                    elif not action.batched:
+                        self.run_command(action, [match], output_queue)
+                    else:
+                        batches[action].append(match)
+                        if len(batches[action]) >= self.exec_batch_size:
+                            self.run_command(action, batches.pop(action),
+                                             output_queue)
+            for command, paths in batches.items():
+                self.run_command(command, paths, output_queue)
 
         except FileNotFoundError as e:
             self.handle_io_exception(e, "Finding files in", path)
         except PermissionError as e:
             self.handle_io_exception(e, "Accessing directory", path)
 
-    def find_files(self, root, pattern):
-        try:
-            matches = []
-            for root_dir, _, filenames in os.walk(root):
-                for filename in fnmatch.filter(filenames, pattern):
-                    full_path = os.path.join(root_dir, filename)
-                    relative_path = os.path.relpath(full_path, start=root)
-                    if not relative_path.startswith('.'):
-                        relative_path = f"{root}/{relative_path}"
-                    matches.append(relative_path)
-            return matches
-        except FileNotFoundError as e:
-            self.handle_io_exception(e, "Reading file", filename)
+    def run_command(self, command, paths, output_queue):
+        # -exec runs applications in-process, writing to find's output.
+        from factory import ApplicationFactory
+        application = ApplicationFactory.create_application(command.command[0])
+        application.exec(command.arguments(paths), output_queue, None,
+                         None, None)
+
+    def find_files(self, root, expression, sort_output=False):
+        """Yield the paths under ``root`` selected by ``expression`` while
+        the tree is being walked, each with the actions to perform on it.
+
+        Directories are listed concurrently on a thread pool, which also
+        runs the predicates, so any ``stat`` calls they need are made in
+        parallel. Without ``sort_output`` paths are yielded in the order
+        the listings complete; with it the walk is depth-first in name
+        order, while the subdirectories of each visited directory are
+        still listed ahead.
+        """
+        actions, descend = expression.visit(RootEntry(root), 0)
+        if actions:
+            yield root, actions
+        if not descend:
+            return
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            root_listing = pool.submit(self.scan_directory, root, 1,
+                                       expression, sort_output, True)
+            if sort_output:
+                yield from self.walk_sorted(pool, root_listing, expression)
+            else:
+                yield from self.walk_unordered(pool, root_listing,
+                                               expression)
+
+    def scan_directory(self, directory, depth, expression, sort_output,
+                       is_root=False):
+        # The expression sees the DirEntry objects of the listing, so tests
+        # on names and types need no stat call and a directory that cannot
+        # hold a match is never listed. Unreadable subdirectories are
+        # skipped.
+        entries = []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    actions, descend = expression.visit(entry, depth)
+                    if actions or descend:
+                        entries.append((entry.name, entry.path, depth,
+                                        descend, actions))
+        except OSError:
+            if is_root:
+                raise
+        if sort_output:
+            entries.sort()
+        return entries
+
+    def walk_unordered(self, pool, root_listing, expression):
+        pending = {root_listing}
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for listing in done:
+                    for (_, path, depth, descend,
+                         actions) in listing.result():
+                        if actions:
+                            yield path, actions
+                        if descend:
+                            pending.add(pool.submit(self.scan_directory,
+                                                    path, depth + 1,
+                                                    expression, False))
+        finally:
+            for listing in pending:
+                listing.cancel()
+
+    def walk_sorted(self, pool, root_listing, expression):
+        def prefetch(entries):
+            return iter([(path, actions,
+                          pool.submit(self.scan_directory, path, depth + 1,
+                                      expression, True)
+                          if descend else None)
+                         for _, path, depth, descend, actions in entries])
+
+        stack = [prefetch(root_listing.result())]
+        try:
+            while stack:
+                entry = next(stack[-1], None)
+                if entry is None:
+                    stack.pop()
+                    continue
+                path, actions, listing = entry
+                if actions:
+                    yield path, actions
+                if listing is not None:
+                    stack.append(prefetch(listing.result()))
+        finally:
+            for entries in stack:
+                for _, _, listing in entries:
+                    if listing is not None:
+                        listing.cancel()
 
 
 class Uniq(Applications):
+    streams_input = True
+    flags = {'i': 'ignore_case', 'c': 'count', 'd': 'repeated',
+             'u': 'unique'}
+    counts = {'-f': 'skip_fields', '-s': 'skip_chars'}
+
     def exec(self, args, output_queue, input_data,
              input_redirection, output_redirection):
+        options, file_to_read = self.parse_options(args)
+        if file_to_read is None:
+            file_to_read = input_redirection
         try:
-            if len(args) > 2:
-                raise ValueError("Expected Format: uniq [-i] [FILE]")
-
-            ignore_case = '-i' in args
-            file_to_read = None
-
-            if ignore_case:
-                args.remove('-i')
-
-            file_to_read = args[0] if args else input_redirection
-
-            last_line = ''
             if file_to_read:
                 with open(file_to_read, 'r') as f:
-                    for line in f:
-                        last_line, output_line = self.process_line(line,
-                                                                   last_line,
-                                                                   ignore_case)
-                        if output_line is not None:
-                            output_queue.append(output_line)
+                    self.process_lines(self.input_lines(f), options,
+                                       output_queue)
             elif input_data:
-                for line in input_data.splitlines(True):
-                    last_line, output_line = self.process_line(line,
-                                                               last_line,
-                                                               ignore_case)
-                    if output_line is not None:
-                        output_queue.append(output_line)
-
-            if not file_to_read and not input_data:
+                self.process_lines(self.input_lines(input_data), options,
+                                   output_queue)
+            else:
                 raise ValueError("No input data provided for Uniq")
 
         except FileNotFoundError as e:
@@ -379,39 +1174,238 @@ class Uniq(Applications):
         except IOError as e:
             self.handle_io_exception(e, "IO error in file", file_to_read)
 
-    def process_line(self, line, last_line, ignore_case):
-        comparison_line = (line.lower().strip()
-                           if ignore_case else line.strip())
-        comparison_last_line = (last_line.lower().strip()
-                                if ignore_case else last_line.strip())
-        if comparison_line != comparison_last_line:
-            return line.strip(), line
-        return last_line, None
+    def parse_options(self, args):
+        options = {name: False for name in self.flags.values()}
+        options.update({name: 0 for name in self.counts.values()})
+        options.update({'global': False, 'memory': None,
+                        'error_rate': 0.001})
+        file_to_read = None
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if arg == '--global':
+                options['global'] = True
+            elif arg.startswith(('--memory', '--false-positive-rate')):
+                name, _, value = arg.partition('=')
+                if name not in ('--memory', '--false-positive-rate'):
+                    raise ValueError(f"Unknown option '{arg}' in uniq "
+                                     "command")
+                if not value and i + 1 < len(args):
+                    value = args[i + 1]
+                    i += 1
+                self.parse_long_option(name, value, options)
+            elif arg in self.counts:
+                if i + 1 >= len(args) or not args[i + 1].isdigit():
+                    raise ValueError(f"Expected a number after '{arg}' "
+                                     "in uniq command")
+                options[self.counts[arg]] = int(args[i + 1])
+                i += 1
+            elif (arg.startswith('-') and len(arg) > 1
+                  and all(flag in self.flags for flag in arg[1:])):
+                for flag in arg[1:]:
+                    options[self.flags[flag]] = True
+            elif file_to_read is None and not arg.startswith('-'):
+                file_to_read = arg
+            else:
+                raise ValueError("Expected Format: uniq [-i] [-c] [-d] [-u] "
+                                 "[-f N] [-s N] [--global] [FILE]")
+            i += 1
+        if options['global'] and (options['count'] or options['repeated']
+                                  or options['unique']):
+            raise ValueError("'--global' cannot be combined with '-c', '-d' "
+                             "or '-u' in uniq command")
+        return options, file_to_read
+
+    def parse_long_option(self, name, value, options):
+        if name == '--memory':
+            options['memory'] = self.parse_size(value, name, 'uniq')
+            return
+        try:
+            options['error_rate'] = float(value)
+            valid = 0 < options['error_rate'] < 1
+        except ValueError:
+            valid = False
+        if not valid:
+            raise ValueError(f"Invalid value '{value}' for '{name}' "
+                             "in uniq command")
+
+    def comparison_key(self, options):
+        # Built once per run; applied exactly once to every line.
+        skip_fields, skip_chars = options['skip_fields'], options['skip_chars']
+        fold = str.casefold if options['ignore_case'] else None
+
+        def key(line):
+            if skip_fields:
+                line = ''.join(re.split(r'(?<=\S)(?=\s)', line,
+                                        skip_fields)[skip_fields:])
+            if skip_chars:
+                line = line[skip_chars:]
+            line = line.strip()
+            return fold(line) if fold else line
+        return key
+
+    def process_lines(self, lines, options, output_queue):
+        """Write one line per group of adjacent lines with equal keys,
+        holding only the current group's first line and size.
+        """
+        key = self.comparison_key(options)
+        if options['global']:
+            self.process_lines_globally(lines, key, options, output_queue)
+            return
+        group_line = group_key = None
+        group_size = 0
+        for line in lines:
+            line_key = key(line)
+            if group_size and line_key == group_key:
+                group_size += 1
+                continue
+            if group_size:
+                self.output_group(group_line, group_size, options,
+                                  output_queue)
+            group_line, group_key, group_size = line, line_key, 1
+        if group_size:
+            self.output_group(group_line, group_size, options, output_queue)
+
+    def process_lines_globally(self, lines, key, options, output_queue):
+        # Lines are output the first time their key is seen, wherever the
+        # earlier copies were; only digests of the keys are kept.
+        seen = SeenLines(options['memory'], options['error_rate'])
+        for line in lines:
+            if seen.add(key(line)):
+                output_queue.append(line + "\n")
+
+    def output_group(self, line, size, options, output_queue):
+        if options['repeated'] and size == 1:
+            return
+        if options['unique'] and size > 1:
+            return
+        if options['count']:
+            output_queue.append(f"{size:7d} {line}\n")
+        else:
+            output_queue.append(line + "\n")
 
 
 class Sort(Applications):
+    streams_input = True
+    buffer_size = DEFAULT_BUFFER_SIZE
+    flags = {'r': 'reverse', 'u': 'unique', 'n': 'numeric',
+             'f': 'fold_case', 's': 'stable'}
+
     def exec(self, args, output_queue, input_data,
              input_redirection, output_redirection):
+        options, file_to_read = self.parse_options(args)
+        if file_to_read is None:
+            file_to_read = input_redirection
         try:
-            reverse_flag = '-r' in args
-            file_to_read = args[-1] if args else input_redirection
-            if not file_to_read and not input_data:
-                raise ValueError("No input data provided for sort command")
+            if file_to_read:
+                with open(file_to_read, 'r') as f:
+                    self.output_sorted(f, options, output_queue)
             elif input_data:
-                lines = sorted(input_data.strip().splitlines(),
-                               reverse=reverse_flag)
-                lines = [line + '\n' for line in lines]
+                self.output_sorted(input_data, options, output_queue)
             else:
-                with open(file_to_read, 'r') as f:
-                    lines = sorted(f.readlines(), reverse=reverse_flag)
-
-            output_queue.extend(lines)
+                raise ValueError("No input data provided for sort command")
 
         except FileNotFoundError as e:
             self.handle_io_exception(e, "Sorting file", file_to_read)
         except IOError as e:
             self.handle_io_exception(e, "IO error in file", file_to_read)
 
+    def parse_options(self, args):
+        options = {'reverse': False, 'unique': False, 'head': None,
+                   'buffer_size': self.buffer_size, 'temp_dir': None,
+                   'parallel': 1}
+        key_options = {'fields': [], 'separator': None, 'numeric': False,
+                       'fold_case': False, 'stable': False}
+        file_to_read = None
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            if arg.startswith('--parallel') or arg.startswith('--head'):
+                name = arg.split('=', 1)[0]
+                value = arg[len(name):]
+                if value in ('', '=') and i + 1 < len(args):
+                    value = '=' + args[i + 1]
+                    i += 1
+                if (name not in ('--parallel', '--head')
+                        or not value.startswith('=')
+                        or not value[1:].isdigit()
+                        or (name == '--parallel' and int(value[1:]) == 0)):
+                    raise ValueError(f"Invalid option '{arg}' in sort "
+                                     "command")
+                options[name[2:]] = int(value[1:])
+            elif arg[:2] in ('-S', '-T', '-t', '-k'):
+                if len(arg) > 2:
+                    arg, value = arg[:2], arg[2:]
+                elif i + 1 < len(args):
+                    value = args[i + 1]
+                    i += 1
+                else:
+                    raise ValueError(f"Expected a value after '{arg}' "
+                                     "in sort command")
+                if arg == '-S':
+                    options['buffer_size'] = self.parse_size(value, arg,
+                                                             'sort')
+                elif arg == '-t':
+                    if len(value) != 1:
+                        raise ValueError("The separator must be a single "
+                                         "character in sort command")
+                    key_options['separator'] = value
+                elif arg == '-k':
+                    key_options['fields'].append(self.parse_key(value))
+                elif not os.path.isdir(value):
+                    raise ValueError(f"The specified path '{value}' "
+                                     "is not valid.")
+                else:
+                    options['temp_dir'] = value
+            elif (len(arg) > 1 and arg.startswith('-')
+                    and all(flag in self.flags for flag in arg[1:])):
+                for flag in arg[1:]:
+                    if flag in ('r', 'u'):
+                        options[self.flags[flag]] = True
+                    else:
+                        key_options[self.flags[flag]] = True
+            elif file_to_read is None and not arg.startswith('-'):
+                file_to_read = arg
+            else:
+                raise ValueError("Expected Format: sort [-runfs] [-t SEP] "
+                                 "[-k F1[,F2]]... [-S SIZE] [-T DIR] "
+                                 "[--parallel=N] [--head=N] [FILE]")
+            i += 1
+        if (key_options['fields'] or key_options['separator'] is not None
+                or key_options['numeric'] or key_options['fold_case']
+                or key_options['stable']):
+            # Lines are duplicates when their keys are equal, whatever
+            # the rest of their text.
+            if options['unique']:
+                key_options['stable'] = True
+            options['key'] = SortKey(**key_options)
+        else:
+            options['key'] = None
+        return options, file_to_read
+
+    @staticmethod
+    def parse_key(value):
+        # F1[,F2]: fields F1 through F2, or to the end of the line.
+        first, comma, last = value.partition(',')
+        if (not first.isdigit() or int(first) == 0
+                or (comma and not last.isdigit())
+                or (last and int(last) < int(first))):
+            raise ValueError(f"Invalid key '{value}' in sort command")
+        return int(first), int(last) if last else None
+
+    def output_sorted(self, input_data, options, output_queue):
+        lines = self.input_lines(input_data)
+        if options['head'] is not None:
+            lines = top_lines(lines, options['head'], key=options['key'],
+                              reverse=options['reverse'],
+                              unique=options['unique'])
+        else:
+            lines = sort_lines(
+                lines, key=options['key'], reverse=options['reverse'],
+                unique=options['unique'], buffer_size=options['buffer_size'],
+                temp_dir=options['temp_dir'], parallel=options['parallel'])
+        output_queue.extend(line + '\n' for line in lines)
+
 
 class History(Applications):
     def exec(self, args, output_queue, input_data,
@@ -452,67 +1446,329 @@ class Rmdir(Applications):
 
 
 class Remove(Applications):
+    flags = {'r': 'recursive', 'R': 'recursive', 'f': 'force',
+             'v': 'verbose'}
+    max_workers = 8
+    # Directories opened by the main thread to find subtrees for the pool.
+    max_expanded = 64
+    # Directories are opened without following symbolic links, so a
+    # directory replaced by a link while it is removed is not followed.
+    directory_flags = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW
+
     def exec(self, args, output_queue, input_data,
              input_redirection, output_redirection):
         try:
-            if not args:
+            options, paths = self.parse_options(args)
+            if not paths and not options['force']:
                 raise ValueError("No arguments provided."
                                  "Please specify files or"
                                  "directories to remove.")
 
-            for file_name in args:
-                os.remove(file_name)
+            if options['recursive']:
+                with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                    for path in paths:
+                        self.remove_path(path, options, output_queue, pool)
+            else:
+                for path in paths:
+                    self.remove_path(path, options, output_queue, None)
 
         except Exception as e:
             self.handle_exception(e, "Error while removing file")
 
+    def parse_options(self, args):
+        options = dict.fromkeys(self.flags.values(), False)
+        paths = []
+        for index, arg in enumerate(args):
+            if arg == '--':
+                paths += args[index + 1:]
+                break
+            if len(arg) > 1 and arg.startswith('-'):
+                if not all(flag in self.flags for flag in arg[1:]):
+                    raise ValueError(f"Invalid option '{arg}' in rm command")
+                for flag in arg[1:]:
+                    options[self.flags[flag]] = True
+            else:
+                paths.append(arg)
+        return options, paths
+
+    def remove_path(self, path, options, output_queue, pool):
+        try:
+            if (options['recursive']
+                    and stat.S_ISDIR(os.lstat(path).st_mode)):
+                if self.is_protected(path):
+                    raise ValueError(f"Refusing to remove '{path}'")
+                fd = os.open(path, self.directory_flags)
+                try:
+                    self.remove_contents(fd, path, options, output_queue,
+                                         pool)
+                finally:
+                    os.close(fd)
+                os.rmdir(path)
+                self.report(f"removed directory '{path}'", options,
+                            output_queue)
+            else:
+                os.remove(path)
+                self.report(f"removed '{path}'", options, output_queue)
+        except FileNotFoundError:
+            if not options['force']:
+                raise
+
+    @staticmethod
+    def is_protected(path):
+        # Like GNU rm --preserve-root, the root directory is never removed,
+        # nor '.' and '..'.
+        return (os.path.basename(os.path.normpath(path)) in ('.', '..')
+                or os.path.realpath(path) == os.path.realpath(os.sep))
+
+    def remove_contents(self, fd, path, options, output_queue, pool):
+        """Empty the directory open as ``fd``. Entries are removed
+        relative to ``fd``, so no path is resolved again. With ``pool``,
+        subtrees are removed concurrently, each one by a single thread.
+        Tasks never wait for other tasks, so the pool cannot deadlock,
+        and each thread only keeps open the directories on its current
+        path.
+        """
+        subdirectories = self.remove_files(fd, path, options, output_queue)
+        if pool is None:
+            for name in subdirectories:
+                self.remove_subdirectory(fd, name, path, options,
+                                         output_queue)
+            return
+        # The top of the tree is opened breadth-first until there are
+        # enough subtrees for every thread, so a directory with a single
+        # child, such as build/lib, is still removed in parallel. The
+        # number of directories opened this way is bounded.
+        subtrees = [(fd, name, path) for name in subdirectories]
+        expanded = []
+        try:
+            while (subtrees and len(subtrees) < self.max_workers
+                    and len(expanded) < self.max_expanded):
+                parent_fd, name, parent_path = subtrees.pop(0)
+                subtree_path = os.path.join(parent_path, name)
+                subtree_fd = os.open(name, self.directory_flags,
+                                     dir_fd=parent_fd)
+                expanded.append((parent_fd, name, subtree_fd, subtree_path))
+                subtrees += [(subtree_fd, child, subtree_path)
+                             for child in self.remove_files(
+                                 subtree_fd, subtree_path, options,
+                                 output_queue)]
+            # Every task must finish before the directories they are
+            # relative to are closed.
+            futures = [pool.submit(self.remove_subdirectory, parent_fd,
+                                   name, parent_path, options, output_queue)
+                       for parent_fd, name, parent_path in subtrees]
+            wait(futures)
+            for future in futures:
+                future.result()
+            # Children were expanded after their parents.
+            for parent_fd, name, _, subtree_path in reversed(expanded):
+                os.rmdir(name, dir_fd=parent_fd)
+                self.report(f"removed directory '{subtree_path}'", options,
+                            output_queue)
+        finally:
+            for _, _, subtree_fd, _ in expanded:
+                os.close(subtree_fd)
+
+    def remove_files(self, fd, path, options, output_queue):
+        """Remove the entries of the directory open as ``fd`` that are not
+        directories, and return the names of its subdirectories."""
+        subdirectories = []
+        with os.scandir(fd) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.name)
+                else:
+                    os.unlink(entry.name, dir_fd=fd)
+                    if options['verbose']:
+                        self.report(
+                            f"removed '{os.path.join(path, entry.name)}'",
+                            options, output_queue)
+        return subdirectories
+
+    def remove_subdirectory(self, parent_fd, name, parent_path, options,
+                            output_queue):
+        path = os.path.join(parent_path, name)
+        fd = os.open(name, self.directory_flags, dir_fd=parent_fd)
+        try:
+            self.remove_contents(fd, path, options, output_queue, None)
+        finally:
+            os.close(fd)
+        os.rmdir(name, dir_fd=parent_fd)
+        self.report(f"removed directory '{path}'", options, output_queue)
+
+    def report(self, message, options, output_queue):
+        if options['verbose']:
+            output_queue.append(message + "\n")
+
 
 class WordCount(Applications):
+    streams_input = True
+    # Files are read in binary blocks of this size.
+    block_size = 1024 * 1024
+    max_workers = 8
+    flags = 'lwc'
+
     def exec(self, args, output_queue, input_data,
              input_redirection, output_redirection):
         try:
-            if not args:
+            options, files = self.parse_options(args)
+            if files:
+                self.output_files(files, options, output_queue)
+            elif input_redirection:
+                counts = self.count_file(input_redirection, options)
+                output_queue.append(self.format_counts(counts, options))
+            elif input_data:
+                counts = self.count_blocks(self.input_blocks(input_data),
+                                           options)
+                output_queue.append(self.format_counts(counts, options))
+            else:
                 raise ValueError("No files or options specified."
                                  "Please provide files or options to count.")
 
-            options = []
-            files = []
-
-            for arg in args:
-                if arg in {'-l', '-w', '-c'}:
-                    options.append(arg)
-                else:
-                    files.append(arg)
-
-            for file_name in files:
-                result = self.process_file(file_name, options)
-                output_queue.append(result)
-
         except Exception as e:
             self.handle_exception(e, "Error while counting")
 
-    def process_file(self, file_name, options):
-        counts = {'-l': 0, '-w': 0, '-c': 0}
-
+    def parse_options(self, args):
+        # Counts are printed in the order their options are first given,
+        # or as lines, words and bytes without options.
+        options = []
+        files = []
+        for arg in args:
+            if (len(arg) > 1 and arg.startswith('-')
+                    and all(flag in self.flags for flag in arg[1:])):
+                options += [f'-{flag}' for flag in arg[1:]
+                            if f'-{flag}' not in options]
+            else:
+                files.append(arg)
+        return options or ['-l', '-w', '-c'], files
+
+    def output_files(self, files, options, output_queue):
+        # Files are counted concurrently, and output in the order given.
+        totals = [0, 0, 0]
+        with ThreadPoolExecutor(
+                max_workers=min(len(files), self.max_workers)) as pool:
+            results = pool.map(self.count_file, files, repeat(options))
+            for file_name, counts in zip(files, results):
+                output_queue.append(self.format_counts(counts, options,
+                                                       file_name))
+                totals = [total + count
+                          for total, count in zip(totals, counts)]
+        if len(files) > 1:
+            output_queue.append(self.format_counts(totals, options, 'total'))
+
+    def format_counts(self, counts, options, name=None):
+        lines, words, size = counts
+        values = {'-l': lines, '-w': words, '-c': size}
+        result = " ".join(f"{values[option]}" for option in options)
+        return f"{result} {name}\n" if name is not None else f"{result}\n"
+
+    def count_file(self, file_name, options):
         try:
             if file_name.startswith('-'):
                 raise FileNotFoundError(f"No such file or directory:"
                                         f"'{file_name}'")
+            if options == ['-c']:
+                # The size of a regular file is known without reading it.
+                info = os.stat(file_name)
+                if stat.S_ISREG(info.st_mode):
+                    return 0, 0, info.st_size
+            with open(file_name, 'rb') as file:
+                return self.count_blocks(
+                    iter(lambda: file.read(self.block_size), b''), options)
 
-            with open(file_name, 'r') as file:
-                for line in file:
-                    counts['-l'] += 1
-                    counts['-w'] += len(line.split())
-                    counts['-c'] += len(line.encode('utf-8'))
+        except Exception as file_exception:
+            self.handle_io_exception(file_exception, "Counting", file_name)
+
+    def input_blocks(self, input_data):
+        if isinstance(input_data, str):
+            yield input_data.encode('utf-8', 'surrogateescape')
+            return
+        chunks = (input_data.chunks() if hasattr(input_data, 'chunks')
+                  else input_data)
+        for chunk in chunks:
+            yield chunk.encode('utf-8', 'surrogateescape')
+
+    def count_blocks(self, blocks, options):
+        lines = words = size = 0
+        count_words = '-w' in options
+        in_word = False
+        for block in blocks:
+            if not block:
+                continue
+            lines += block.count(b'\n')
+            size += len(block)
+            if count_words:
+                words += len(block.split())
+                # A word cut by the end of the previous block was counted
+                # in both blocks.
+                if in_word and not block[:1].isspace():
+                    words -= 1
+                in_word = not block[-1:].isspace()
+        return lines, words, size
+
+
+class Index(Applications):
+    def exec(self, args, output_queue, input_data,
+             input_redirection, output_redirection):
+        if len(args) != 2 or args[0] not in ('build', 'update'):
+            raise ValueError("Expected format: index build|update DIR")
+        command, directory = args
+        if not os.path.isdir(directory):
+            raise ValueError(f"The specified path '{directory}' "
+                             "is not valid.")
+        try:
+            total, read = build_trigram_index(directory,
+                                              update=command == 'update')
+        except PermissionError as e:
+            self.handle_io_exception(e, "Permission Error", directory)
+        except IOError as e:
+            self.handle_io_exception(e, "Indexing", directory)
+        output_queue.append(f"Indexed {total} files in {directory} "
+                            f"({read} read)\n")
 
-            result = " ".join(f"{counts[option]}" for option in options)
-            result += f" {file_name}\n"
 
-            if not options:
-                result = (f"{counts['-l']} {counts['-w']} "
-                          f"{counts['-c']} {file_name}\n")
+class Updatedb(Applications):
+    def exec(self, args, output_queue, input_data,
+             input_redirection, output_redirection):
+        if len(args) > 1:
+            raise ValueError("Expected format: updatedb [DIR]")
+        directory = args[0] if args else "."
+        if not os.path.isdir(directory):
+            raise ValueError(f"The specified path '{directory}' "
+                             "is not valid.")
+        try:
+            total, listed = build_locate_index(directory)
+        except PermissionError as e:
+            self.handle_io_exception(e, "Permission Error", directory)
+        except IOError as e:
+            self.handle_io_exception(e, "Indexing", directory)
+        output_queue.append(f"Indexed {total} entries in {directory} "
+                            f"({listed} read)\n")
 
-            return result
 
-        except Exception as file_exception:
-            self.handle_io_exception(file_exception, "Counting", file_name)
+class Locate(Applications):
+    def exec(self, args, output_queue, input_data,
+             input_redirection, output_redirection):
+        index_path = None
+        if len(args) == 3 and args[0] == '-d':
+            index_path = args[1]
+        elif len(args) != 1:
+            raise ValueError("Expected format: locate [-d INDEX] PATTERN")
+        pattern = args[-1]
+        if pattern.strip() == '':
+            raise ValueError("A search pattern must be provided.")
+        try:
+            if index_path is None:
+                index = find_locate_index(os.getcwd())
+                if index is None:
+                    raise ValueError("No locate index found in the current "
+                                     "directory or its parents; run "
+                                     "'updatedb DIR' first")
+            else:
+                stat = os.stat(index_path)
+                index = open_locate_index(index_path, stat.st_mtime_ns,
+                                          stat.st_size)
+        except IOError as e:
+            self.handle_io_exception(e, "Reading index", index_path)
+        for path in index.search(pattern):
+            output_queue.append(path + "\n")
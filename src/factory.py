@@ -1,6 +1,7 @@
 from applications import (Pwd, Cd, Echo, Ls, Cat, Head, Tail,
                           Grep, Cut, Find, Uniq, Sort, Mkdir,
-                          Rmdir, WordCount, Remove, History)
+                          Rmdir, WordCount, Remove, History, Index,
+                          Updatedb, Locate)
 from decorators import unsafe_application
 
 
@@ -34,6 +35,9 @@ class ApplicationFactory:
         'wc': WordCount,
         'rm': Remove,
         'history': History,
+        'index': Index,
+        'updatedb': Updatedb,
+        'locate': Locate,
     }
 
     @staticmethod
@@ -0,0 +1,82 @@
+from hashlib import blake2b
+import math
+
+# Rough size of one 64-bit digest in a Python set: the int object plus
+# its share of the hash table.
+SET_ENTRY_SIZE = 64
+
+
+def line_digest(key):
+    """Return the 64-bit blake2b digest of ``key`` as an int."""
+    digest = blake2b(key.encode('utf-8', 'surrogateescape'), digest_size=8)
+    return int.from_bytes(digest.digest(), 'little')
+
+
+class BloomFilter:
+    """Fixed-size set membership test that may report false positives but
+    never false negatives. ``capacity`` items can be added while keeping
+    the false-positive rate below ``error_rate``.
+    """
+
+    def __init__(self, size_bytes, error_rate):
+        self.bit_count = max(8, size_bytes * 8)
+        self.bits = bytearray(self.bit_count // 8)
+        self.capacity = max(1, int(-self.bit_count * math.log(2) ** 2
+                                   / math.log(error_rate)))
+        self.hash_count = max(1, round(self.bit_count / self.capacity
+                                       * math.log(2)))
+
+    def positions(self, digest):
+        # Double hashing: the two halves of the digest generate all the
+        # bit positions.
+        first, second = digest & 0xFFFFFFFF, (digest >> 32) | 1
+        return [(first + i * second) % self.bit_count
+                for i in range(self.hash_count)]
+
+    def add(self, digest):
+        """Add ``digest``; return whether it was (possibly) present."""
+        present = True
+        bits = self.bits
+        for position in self.positions(digest):
+            byte, mask = position >> 3, 1 << (position & 7)
+            if not bits[byte] & mask:
+                present = False
+                bits[byte] |= mask
+        return present
+
+
+class SeenLines:
+    """Remembers the digests of the lines seen so far.
+
+    Digests are kept in a set, where two different lines sharing a 64-bit
+    digest is vanishingly unlikely, until it would outgrow
+    ``memory_limit`` bytes; from then on they go into a Bloom filter of
+    that size, so memory stays bounded at the cost of occasionally taking
+    a new line for one already seen (at most ``error_rate`` of them).
+    """
+
+    def __init__(self, memory_limit=None, error_rate=0.001):
+        self.memory_limit = memory_limit
+        self.error_rate = error_rate
+        self.digests = set()
+        self.bloom_filter = None
+
+    def add(self, key):
+        """Record the line with comparison ``key``; return whether it was
+        new."""
+        digest = line_digest(key)
+        if self.bloom_filter is not None:
+            return not self.bloom_filter.add(digest)
+        if digest in self.digests:
+            return False
+        self.digests.add(digest)
+        if (self.memory_limit is not None
+                and len(self.digests) * SET_ENTRY_SIZE > self.memory_limit):
+            self.switch_to_bloom_filter()
+        return True
+
+    def switch_to_bloom_filter(self):
+        self.bloom_filter = BloomFilter(self.memory_limit, self.error_rate)
+        for digest in self.digests:
+            self.bloom_filter.add(digest)
+        self.digests = set()
@@ -0,0 +1,610 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from functools import lru_cache
+from matchers import is_literal
+import fnmatch
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+
+TRIGRAM_INDEX_NAME = '.trigram-index'
+TRIGRAM_MAGIC = b'TRIGRAM1'
+TRIGRAM_HEADER = struct.Struct('<8sQQQ')
+BINARY_SNIFF_SIZE = 8192
+HEX_ESCAPE_LENGTHS = {'x': 2, 'u': 4, 'U': 8}
+
+
+def trigram_keys(data):
+    data = data.lower()
+    grams = {data[i:i + 3] for i in range(len(data) - 2)}
+    return {int.from_bytes(gram, 'big') for gram in grams}
+
+
+def required_literals(pattern):
+    """Return literal strings that every match of the regex ``pattern``
+    must contain, or ``None`` if that cannot be worked out cheaply.
+
+    The analysis is conservative: alternation gives up, groups and
+    character classes are skipped, and a character followed by ``?``,
+    ``*`` or ``{`` is treated as optional. Case does not matter because
+    the index is built from lowercased text.
+    """
+    if '|' in pattern or '(?' in pattern:
+        return None
+    literals, run = [], ''
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            escaped = pattern[i + 1:i + 2]
+            if escaped and not escaped.isalnum():
+                run += escaped
+                i += 2
+                continue
+            # Escapes such as \\w, \\x41, \\N{...} or \\1 do not stand
+            # for their own text: they end the run and are skipped whole.
+            literals.append(run)
+            run = ''
+            i = escape_end(pattern, i)
+            continue
+        if char in '?*{':
+            run = run[:-1]
+        if char in '[(':
+            closing = ']' if char == '[' else ')'
+            depth, i = 1, i + 1
+            if char == '[':
+                # As in re, a ']' first in the set (after any '^') is
+                # literal rather than closing it.
+                i += pattern.startswith('^', i)
+                i += pattern.startswith(']', i)
+            while i < len(pattern) and depth:
+                if pattern[i] == '\\':
+                    i += 1
+                elif pattern[i] == char and char == '(':
+                    depth += 1
+                elif pattern[i] == closing:
+                    depth -= 1
+                i += 1
+            literals.append(run)
+            run = ''
+            continue
+        if char in '.^$+?*{})]':
+            literals.append(run)
+            run = ''
+            if char == '{' and pattern.find('}', i) != -1:
+                i = pattern.find('}', i)
+        else:
+            run += char
+        i += 1
+    literals.append(run)
+    return [literal for literal in literals if literal]
+
+
+def escape_end(pattern, start):
+    """Return the index just past the alphanumeric escape at ``start``."""
+    kind = pattern[start + 1:start + 2]
+    end = start + 2
+    if kind in HEX_ESCAPE_LENGTHS:
+        return end + HEX_ESCAPE_LENGTHS[kind]
+    if kind == 'N' and pattern[end:end + 1] == '{':
+        closing = pattern.find('}', end)
+        return len(pattern) if closing == -1 else closing + 1
+    if kind.isdigit():
+        # Octal escapes and backreferences take up to three digits.
+        while end < min(start + 4, len(pattern)) and pattern[end].isdigit():
+            end += 1
+    return end
+
+
+class TrigramIndex:
+    """Read-only view of an on-disk trigram index.
+
+    The file holds a JSON table of the indexed files (path relative to
+    the indexed directory, mtime, size and whether the file is binary)
+    followed by three arrays of
+    unsigned 32-bit integers: the sorted trigram keys, the offsets of
+    their posting lists and the posting lists themselves (file numbers).
+    The arrays are read straight from a memory map, so opening an index
+    costs little more than parsing the file table.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.root = os.path.dirname(os.path.abspath(path))
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, meta_size, key_count, posting_count = \
+            TRIGRAM_HEADER.unpack_from(self.mm)
+        if magic != TRIGRAM_MAGIC:
+            raise ValueError(f"'{path}' is not a trigram index")
+        start = TRIGRAM_HEADER.size
+        meta = json.loads(self.mm[start:start + meta_size])
+        if meta['byteorder'] != sys.byteorder:
+            raise ValueError(f"'{path}' was built on another platform")
+        self.files = meta['files']
+        self.file_numbers = {entry[0]: number
+                             for number, entry in enumerate(self.files)}
+        view = memoryview(self.mm)
+        start += meta_size
+        self.keys = view[start:start + 4 * key_count].cast('I')
+        start += 4 * key_count
+        self.offsets = view[start:start + 4 * (key_count + 1)].cast('I')
+        start += 4 * (key_count + 1)
+        self.postings = view[start:start + 4 * posting_count].cast('I')
+
+    def close(self):
+        for view in (self.keys, self.offsets, self.postings):
+            view.release()
+        self.mm.close()
+
+    def posting_list(self, key):
+        position = bisect_left(self.keys, key)
+        if position == len(self.keys) or self.keys[position] != key:
+            return ()
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return self.postings[start:end]
+
+    def files_with_all(self, keys):
+        lists = sorted((self.posting_list(key) for key in keys), key=len)
+        numbers = set(lists[0])
+        for posting_list in lists[1:]:
+            if not numbers:
+                break
+            numbers.intersection_update(posting_list)
+        return {self.files[number][0] for number in numbers}
+
+    def candidates(self, patterns, fixed=False, ignore_case=False):
+        """Return the indexed paths that may contain a match for any of
+        ``patterns``, or ``None`` if the index cannot narrow the search.
+        """
+        result = set()
+        for pattern in patterns:
+            literals = ([pattern] if fixed or is_literal(pattern)
+                        else required_literals(pattern)) or []
+            keys = set()
+            for literal in literals:
+                if not (ignore_case and not literal.isascii()):
+                    keys |= trigram_keys(literal.encode('utf-8'))
+            if not keys:
+                return None
+            result |= self.files_with_all(keys)
+        return result
+
+    def is_current(self, relative_path, stat):
+        number = self.file_numbers.get(relative_path)
+        if number is None:
+            return False
+        _, mtime, size, _ = self.files[number]
+        return mtime == stat.st_mtime_ns and size == stat.st_size
+
+    def is_binary(self, relative_path):
+        return self.files[self.file_numbers[relative_path]][3]
+
+    def covers(self, relative_path, stat):
+        # Binary files are recorded so that updates can skip them, but
+        # their content is not indexed.
+        return (self.is_current(relative_path, stat)
+                and not self.is_binary(relative_path))
+
+
+@lru_cache(maxsize=16)
+def open_trigram_index(path, mtime, size):
+    return TrigramIndex(path)
+
+
+def find_trigram_index(directory, cache):
+    """Return the index covering ``directory`` (stored in it or in one of
+    its parents), or ``None``. ``cache`` maps directories already looked
+    up to their result.
+    """
+    visited = []
+    while directory not in cache:
+        visited.append(directory)
+        path = os.path.join(directory, TRIGRAM_INDEX_NAME)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                cache[directory] = None
+                break
+            directory = parent
+            continue
+        cache[directory] = open_trigram_index(path, stat.st_mtime_ns,
+                                              stat.st_size)
+    index = cache[directory]
+    for path in visited:
+        cache[path] = index
+    return index
+
+
+def indexable_files(root):
+    directories = [root]
+    while directories:
+        directory = directories.pop()
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif (entry.is_file(follow_symlinks=False)
+                      and not entry.name.startswith(TRIGRAM_INDEX_NAME)):
+                    yield entry, os.path.relpath(entry.path, root)
+
+
+def build_trigram_index(root, update=False):
+    """Write the trigram index of ``root``; return the number of text files
+    in the index and the number of files that had to be read.
+
+    With ``update``, files whose mtime and size match the existing index
+    keep their trigrams and are not read again.
+    """
+    root = os.path.abspath(root)
+    index_path = os.path.join(root, TRIGRAM_INDEX_NAME)
+    previous = None
+    if update and os.path.exists(index_path):
+        previous = TrigramIndex(index_path)
+
+    entries = []
+    for entry, relative_path in indexable_files(root):
+        stat = entry.stat(follow_symlinks=False)
+        entries.append((relative_path, stat))
+    entries.sort(key=lambda item: item[0])
+
+    unchanged = set()
+    if previous is not None:
+        unchanged = {relative_path for relative_path, stat in entries
+                     if previous.is_current(relative_path, stat)}
+    reused = defaultdict(set)
+    if unchanged:
+        for position in range(len(previous.keys)):
+            key = previous.keys[position]
+            start = previous.offsets[position]
+            end = previous.offsets[position + 1]
+            for number in previous.postings[start:end]:
+                relative_path = previous.files[number][0]
+                if relative_path in unchanged:
+                    reused[relative_path].add(key)
+
+    files, postings, read = [], defaultdict(list), 0
+    for relative_path, stat in entries:
+        if relative_path in unchanged:
+            binary = previous.is_binary(relative_path)
+            keys = reused[relative_path]
+        else:
+            try:
+                with open(os.path.join(root, relative_path), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue
+            read += 1
+            binary = b'\0' in data[:BINARY_SNIFF_SIZE]
+            keys = () if binary else trigram_keys(data)
+        number = len(files)
+        files.append([relative_path, stat.st_mtime_ns, stat.st_size,
+                      binary])
+        for key in keys:
+            postings[key].append(number)
+    if previous is not None:
+        previous.close()
+
+    write_trigram_index(index_path, files, postings)
+    return sum(not binary for _, _, _, binary in files), read
+
+
+def write_trigram_index(index_path, files, postings):
+    meta = json.dumps({'byteorder': sys.byteorder, 'files': files})
+    meta = meta.encode('utf-8')
+    meta += b' ' * (-len(meta) % 4)
+    keys = array('I', sorted(postings))
+    offsets = array('I', [0])
+    lists = array('I')
+    for key in keys:
+        lists.extend(postings[key])
+        offsets.append(len(lists))
+    temporary_path = index_path + '.tmp'
+    with open(temporary_path, 'wb') as f:
+        f.write(TRIGRAM_HEADER.pack(TRIGRAM_MAGIC, len(meta),
+                                    len(keys), len(lists)))
+        f.write(meta)
+        f.write(keys.tobytes())
+        f.write(offsets.tobytes())
+        f.write(lists.tobytes())
+    os.replace(temporary_path, index_path)
+
+
+LOCATE_INDEX_NAME = '.locate-index'
+LOCATE_MAGIC = b'LOCATE01'
+LOCATE_HEADER = struct.Struct('<8sQQQQQ')
+LOCATE_RESTART_INTERVAL = 16
+PREFIX_LENGTH = struct.Struct('<H')
+
+
+class LocateIndex:
+    """Read-only view of an on-disk file name index (see ``updatedb``).
+
+    Entries are grouped by directory. Each directory has a record holding
+    its mtime, its parent and the number of its first entry; the paths of
+    the directories are front-coded, storing only what differs from the
+    previous path, with every 16th path stored whole so that any of them
+    can be decoded in a few steps. The names of all entries follow, one
+    per line, so that a query can scan them in place in the memory map.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.root = os.path.dirname(os.path.abspath(path))
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, little_endian, directory_count, entry_count, paths_size,
+         names_size) = LOCATE_HEADER.unpack_from(self.mm)
+        if magic != LOCATE_MAGIC:
+            raise ValueError(f"'{path}' is not a locate index")
+        if little_endian != (sys.byteorder == 'little'):
+            raise ValueError(f"'{path}' was built on another platform")
+        view = memoryview(self.mm)
+        start = LOCATE_HEADER.size
+        self.mtimes = view[start:start + 8 * directory_count].cast('q')
+        start += 8 * directory_count
+        self.parents = view[start:start + 4 * directory_count].cast('i')
+        start += 4 * directory_count
+        self.first_entries = view[
+            start:start + 4 * (directory_count + 1)].cast('I')
+        start += 4 * (directory_count + 1)
+        self.path_offsets = view[
+            start:start + 4 * (directory_count + 1)].cast('I')
+        start += 4 * (directory_count + 1)
+        self.name_offsets = view[start:start + 4 * (entry_count + 1)].cast('I')
+        start += 4 * (entry_count + 1)
+        self.paths_start = start
+        self.names_start = start + paths_size + (-paths_size % 4)
+        self.names_end = self.names_start + names_size
+
+    def close(self):
+        for view in (self.mtimes, self.parents, self.first_entries,
+                     self.path_offsets, self.name_offsets):
+            view.release()
+        self.mm.close()
+
+    def path_record(self, number):
+        start = self.paths_start + self.path_offsets[number]
+        end = self.paths_start + self.path_offsets[number + 1]
+        shared, = PREFIX_LENGTH.unpack_from(self.mm, start)
+        return shared, self.mm[start + PREFIX_LENGTH.size:end]
+
+    def directory_path(self, number):
+        path = b''
+        for current in range(number - number % LOCATE_RESTART_INTERVAL,
+                             number + 1):
+            shared, rest = self.path_record(current)
+            path = path[:shared] + rest
+        return path
+
+    def directory_paths(self):
+        path = b''
+        for number in range(len(self.mtimes)):
+            shared, rest = self.path_record(number)
+            path = path[:shared] + rest
+            yield path
+
+    def entry_name(self, number):
+        start = self.names_start + self.name_offsets[number]
+        end = self.names_start + self.name_offsets[number + 1] - 1
+        return self.mm[start:end]
+
+    def entry_names(self, directory):
+        return [self.entry_name(number)
+                for number in range(self.first_entries[directory],
+                                    self.first_entries[directory + 1])]
+
+    def entry_path(self, number):
+        directory = bisect_right(self.first_entries, number) - 1
+        directory_path = self.directory_path(directory)
+        name = self.entry_name(number)
+        return directory_path + b'/' + name if directory_path else name
+
+    def search(self, pattern):
+        """Yield the absolute paths of the indexed entries matching the
+        ``fnmatch`` ``pattern``.
+
+        As with ``find -name``, the pattern is matched against the entry
+        name, or against the whole path if it contains a ``/``. Only the
+        names containing the longest literal part of the pattern that
+        must appear in the name are decoded and checked.
+        """
+        parts = literal_parts(pattern)
+        if '/' in pattern:
+            # A '*' may match across '/', so only what follows the last
+            # '*' and the last '/' is known to be part of the name.
+            runs = parts[-1]
+            for index in range(len(runs) - 1, -1, -1):
+                if '/' in runs[index]:
+                    runs = [runs[index].rsplit('/', 1)[-1]] + runs[index + 1:]
+                    break
+        else:
+            runs = [run for part in parts for run in part]
+        literal = os.fsencode(max(runs, key=len))
+        matches = re.compile(fnmatch.translate(pattern)).match
+        position = self.names_start
+        while True:
+            hit = self.mm.find(literal, position, self.names_end)
+            if hit == -1 or hit == self.names_end:
+                return
+            number = bisect_right(self.name_offsets,
+                                  hit - self.names_start) - 1
+            position = self.names_start + self.name_offsets[number + 1]
+            if '/' in pattern:
+                path = os.path.join(self.root,
+                                    os.fsdecode(self.entry_path(number)))
+                if matches(path):
+                    yield path
+            elif matches(os.fsdecode(self.entry_name(number))):
+                yield os.path.join(self.root,
+                                   os.fsdecode(self.entry_path(number)))
+
+
+def literal_parts(pattern):
+    """Split the ``fnmatch`` ``pattern`` at each ``*`` into parts, and
+    each part into the runs of literal text between ``?`` and bracket
+    expressions, which stand for one unknown character.
+    """
+    parts, runs, run = [], [], ''
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        i += 1
+        if char == '[':
+            # As in fnmatch, a ']' first in the brackets is literal, and
+            # a '[' without a closing ']' is an ordinary character.
+            end = i + 1 if pattern[i:i + 1] == '!' else i
+            end = pattern.find(']', end + 1)
+            if end != -1:
+                runs.append(run)
+                run, i = '', end + 1
+                continue
+        if char in '*?':
+            runs.append(run)
+            run = ''
+            if char == '*':
+                parts.append(runs)
+                runs = []
+        else:
+            run += char
+    parts.append(runs + [run])
+    return parts
+
+
+@lru_cache(maxsize=16)
+def open_locate_index(path, mtime, size):
+    return LocateIndex(path)
+
+
+def find_locate_index(directory):
+    """Return the locate index stored in ``directory`` or in the nearest of
+    its parents, or ``None``.
+    """
+    directory = os.path.abspath(directory)
+    while True:
+        path = os.path.join(directory, LOCATE_INDEX_NAME)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                return None
+            directory = parent
+            continue
+        return open_locate_index(path, stat.st_mtime_ns, stat.st_size)
+
+
+def build_locate_index(root):
+    """Write the locate index of ``root``; return the number of entries in
+    the index and the number of directories that had to be listed.
+
+    If an index already exists, directories whose mtime did not change
+    keep their entries and are not listed again. Creating, deleting or
+    renaming an entry changes the mtime of its directory, so only the
+    directories that changed are read; every directory is still stat'ed.
+    """
+    root = os.path.abspath(root)
+    index_path = os.path.join(root, LOCATE_INDEX_NAME)
+    previous, known, children = None, {}, defaultdict(list)
+    if os.path.exists(index_path):
+        previous = LocateIndex(index_path)
+        for number, path in enumerate(previous.directory_paths()):
+            known[path] = number
+            if previous.parents[number] >= 0:
+                children[previous.parents[number]].append(path)
+
+    mtimes, parents, paths, first_entries, names = [], [], [], [], []
+    listed = 0
+    stack = [(b'', -1)]
+    while stack:
+        relative_path, parent = stack.pop()
+        directory = os.path.join(root, os.fsdecode(relative_path))
+        try:
+            stat = os.stat(directory, follow_symlinks=False)
+        except OSError:
+            if not relative_path:
+                raise
+            continue
+        number = known.get(relative_path)
+        if number is not None and previous.mtimes[number] == \
+                stat.st_mtime_ns:
+            entries = previous.entry_names(number)
+            subdirectories = children[number]
+        else:
+            listed += 1
+            entries, subdirectories = list_directory(root, relative_path)
+        own_number = len(paths)
+        mtimes.append(stat.st_mtime_ns)
+        parents.append(parent)
+        paths.append(relative_path)
+        first_entries.append(len(names))
+        names.extend(entries)
+        for path in sorted(subdirectories, reverse=True):
+            stack.append((path, own_number))
+    if previous is not None:
+        previous.close()
+
+    write_locate_index(index_path, mtimes, parents, paths, first_entries,
+                       names)
+    return len(names), listed
+
+
+def list_directory(root, relative_path):
+    entries, subdirectories = [], []
+    try:
+        with os.scandir(os.path.join(root, os.fsdecode(relative_path))) as it:
+            for entry in it:
+                name = os.fsencode(entry.name)
+                # The names are stored one per line.
+                if b'\n' in name or (not relative_path and entry.name
+                                     .startswith(LOCATE_INDEX_NAME)):
+                    continue
+                entries.append(name)
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(relative_path + b'/' + name
+                                          if relative_path else name)
+    except OSError:
+        if not relative_path:
+            raise
+    entries.sort()
+    return entries, subdirectories
+
+
+def write_locate_index(index_path, mtimes, parents, paths, first_entries,
+                       names):
+    encoded_paths, path_offsets, previous = bytearray(), array('I'), b''
+    for number, path in enumerate(paths):
+        shared = 0
+        if number % LOCATE_RESTART_INTERVAL:
+            shared = min(len(os.path.commonprefix((previous, path))),
+                         0xFFFF)
+        path_offsets.append(len(encoded_paths))
+        encoded_paths += PREFIX_LENGTH.pack(shared) + path[shared:]
+        previous = path
+    path_offsets.append(len(encoded_paths))
+    name_offsets, position = array('I'), 0
+    for name in names:
+        name_offsets.append(position)
+        position += len(name) + 1
+    name_offsets.append(position)
+
+    temporary_path = index_path + '.tmp'
+    with open(temporary_path, 'wb') as f:
+        f.write(LOCATE_HEADER.pack(LOCATE_MAGIC, sys.byteorder == 'little',
+                                   len(paths), len(names),
+                                   len(encoded_paths), position))
+        f.write(array('q', mtimes).tobytes())
+        f.write(array('i', parents).tobytes())
+        f.write(array('I', first_entries + [len(names)]).tobytes())
+        f.write(path_offsets.tobytes())
+        f.write(name_offsets.tobytes())
+        f.write(encoded_paths + b'\0' * (-len(encoded_paths) % 4))
+        for name in names:
+            f.write(name + b'\n')
+    os.replace(temporary_path, index_path)
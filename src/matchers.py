@@ -0,0 +1,225 @@
+from collections import deque
+from functools import lru_cache
+import re
+
+REGEX_METACHARACTERS = frozenset('.^$*+?{}[]\\|()')
+# With IGNORECASE, str patterns also match non-ASCII letters for these:
+# 'İ' and 'ı' for i, 'K' (Kelvin sign) for k and 'ſ' for s.
+NON_ASCII_CASE_LETTERS = frozenset('iksIKS')
+
+
+def is_literal(pattern):
+    return not any(char in REGEX_METACHARACTERS for char in pattern)
+
+
+def is_word_char(char):
+    return char.isalnum() or char == '_'
+
+
+@lru_cache(maxsize=256)
+def compile_matcher(patterns, fixed=False, ignore_case=False,
+                    whole_word=False, invert=False):
+    """Return a function telling whether a line matches any of ``patterns``.
+
+    Matchers are cached for the lifetime of the process, so scripts that
+    run the same search repeatedly compile it only once. Fixed strings and
+    patterns without regex metacharacters use substring search instead of
+    the regex engine; several of them are combined into one Aho-Corasick
+    automaton. The remaining patterns share a single compiled regex.
+    """
+    if isinstance(patterns, str):
+        patterns = (patterns,)
+    literals = [pattern for pattern in patterns
+                if fixed or is_literal(pattern)]
+    regexes = [pattern for pattern in patterns
+               if not (fixed or is_literal(pattern))]
+    matchers = []
+    if len(literals) == 1:
+        matchers.append(literal_matcher(literals[0], ignore_case,
+                                        whole_word))
+    elif literals:
+        matchers.append(automaton_matcher(literals, ignore_case,
+                                          whole_word))
+    if regexes:
+        matchers.append(regex_matcher(
+            "|".join(f"(?:{pattern})" for pattern in regexes)
+            if len(regexes) > 1 else regexes[0],
+            ignore_case, whole_word))
+
+    if invert:
+        return lambda line: not any(match(line) for match in matchers)
+    if len(matchers) == 1:
+        return matchers[0]
+    return lambda line: any(match(line) for match in matchers)
+
+
+def literal_matcher(needle, ignore_case, whole_word):
+    if ignore_case:
+        needle = needle.lower()
+    if not whole_word:
+        if ignore_case:
+            return lambda line: needle in line.lower()
+        return lambda line: needle in line
+
+    def matches(line):
+        if ignore_case:
+            line = line.lower()
+        start = line.find(needle)
+        while start != -1:
+            end = start + len(needle)
+            if ((start == 0 or not is_word_char(line[start - 1]))
+                    and (end == len(line) or not is_word_char(line[end]))):
+                return True
+            start = line.find(needle, start + 1)
+        return False
+    return matches
+
+
+def regex_matcher(pattern, ignore_case, whole_word):
+    if whole_word:
+        pattern = rf"(?<!\w)(?:{pattern})(?!\w)"
+    try:
+        search = re.compile(pattern,
+                            re.IGNORECASE if ignore_case else 0).search
+    except re.error as e:
+        raise ValueError(f"Invalid pattern '{pattern}': {e}")
+    return lambda line: search(line) is not None
+
+
+def automaton_matcher(needles, ignore_case, whole_word):
+    if ignore_case:
+        needles = [needle.lower() for needle in needles]
+    automaton = AhoCorasick(needles)
+    if not whole_word:
+        if ignore_case:
+            return lambda line: automaton.search(line.lower())
+        return automaton.search
+
+    def matches(line):
+        if ignore_case:
+            line = line.lower()
+        for start, end in automaton.finditer(line):
+            if ((start == 0 or not is_word_char(line[start - 1]))
+                    and (end == len(line) or not is_word_char(line[end]))):
+                return True
+        return False
+    return matches
+
+
+class AhoCorasick:
+    """Automaton that finds occurrences of many literal strings in a single
+    pass over the text, in time linear in its length.
+    """
+
+    def __init__(self, needles):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for needle in needles:
+            self.add(needle)
+        self.link()
+
+    def add(self, needle):
+        state = 0
+        for char in needle:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(())
+                self.goto[state][char] = next_state
+            state = next_state
+        if len(needle) not in self.output[state]:
+            self.output[state] += (len(needle),)
+
+    def link(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] += self.output[self.fail[next_state]]
+
+    def search(self, text):
+        goto, fail, output = self.goto, self.fail, self.output
+        if output[0]:
+            return True
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                return True
+        return False
+
+    def finditer(self, text):
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        if output[0]:
+            yield 0, 0
+        for index, char in enumerate(text, 1):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length in output[state]:
+                yield index - length, index
+
+
+@lru_cache(maxsize=256)
+def compile_bytes_regex(patterns, fixed=False, ignore_case=False,
+                        whole_word=False):
+    """Compile ``patterns`` into one bytes regex for scanning raw file
+    buffers, or return ``None`` when they cannot be expressed as such.
+
+    Because the regex runs over a whole buffer it may find candidates that
+    span lines, so every candidate line must be confirmed with the line
+    matcher from ``compile_matcher``. Only patterns that find every line
+    the str matcher finds are accepted, so confirming the candidates
+    never loses a match.
+    """
+    if not patterns or not all(pattern.isascii() for pattern in patterns):
+        return None
+    if not all(matches_same_bytes(pattern, fixed or is_literal(pattern),
+                                  ignore_case) for pattern in patterns):
+        return None
+    sources = [re.escape(pattern) if fixed or is_literal(pattern)
+               else pattern for pattern in patterns]
+    source = "|".join(f"(?:{source})" for source in sources)
+    if whole_word:
+        source = rf"(?<!\w)(?:{source})(?!\w)"
+    flags = re.MULTILINE | (re.IGNORECASE if ignore_case else 0)
+    try:
+        return re.compile(source.encode('ascii'), flags)
+    except re.error:
+        return None
+
+
+def matches_same_bytes(pattern, literal, ignore_case):
+    """Tell whether ``pattern`` as a bytes regex matches at least wherever
+    it matches as a str regex, on UTF-8 text.
+
+    A bytes regex sees each byte of a multibyte character separately, so
+    ``.``, classes, ``\\w``-style escapes and escapes denoting characters
+    (``\\xe9``) would miss non-ASCII text; such patterns are rejected.
+    """
+    if ignore_case and NON_ASCII_CASE_LETTERS.intersection(pattern):
+        return False
+    if literal:
+        return True
+    escaped = False
+    for char in pattern:
+        if escaped:
+            if char.isalnum():
+                return False
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char in '.[':
+            return False
+    return True
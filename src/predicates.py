@@ -0,0 +1,431 @@
+import fnmatch
+import math
+import os
+import re
+import stat
+import time
+
+SIZE_UNITS = {'b': 512, 'c': 1, 'w': 2, 'k': 1024, 'M': 1024 ** 2,
+              'G': 1024 ** 3}
+FILE_TYPES = 'fdl'
+
+
+class Visit:
+    """An entry met during the walk, as seen by the predicates: its
+    ``os.DirEntry`` (or a compatible object), its depth below the starting
+    point and the actions that evaluating the expression requested.
+    """
+
+    def __init__(self, entry, depth):
+        self.entry = entry
+        self.depth = depth
+        self.pruned = False
+        self.actions = []
+
+
+class RootEntry:
+    """Stand-in for the ``os.DirEntry`` of the starting point of a walk."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(os.path.normpath(path))
+        self._stat = None
+
+    def stat(self, follow_symlinks=True):
+        if self._stat is None:
+            self._stat = os.stat(self.path, follow_symlinks=False)
+        return self._stat
+
+    def is_dir(self, follow_symlinks=True):
+        return stat.S_ISDIR(self.stat().st_mode)
+
+    def is_file(self, follow_symlinks=True):
+        return stat.S_ISREG(self.stat().st_mode)
+
+    def is_symlink(self):
+        return stat.S_ISLNK(self.stat().st_mode)
+
+
+class Predicate:
+    # Predicates that need ``stat`` are evaluated after the ones that can
+    # be answered from the directory listing; predicates with side effects
+    # (actions) are never moved.
+    needs_stat = False
+    has_side_effects = False
+
+    def __call__(self, visit):
+        raise NotImplementedError
+
+    def may_match_below(self, path):
+        return True
+
+    def contains(self, predicate_class):
+        return isinstance(self, predicate_class)
+
+
+class Name(Predicate):
+    def __init__(self, pattern):
+        self.match = re.compile(fnmatch.translate(pattern)).match
+
+    def __call__(self, visit):
+        return self.match(visit.entry.name) is not None
+
+
+class Path(Predicate):
+    def __init__(self, pattern):
+        self.match = re.compile(fnmatch.translate(pattern), re.DOTALL).match
+        # Every path matching the pattern starts with its literal prefix,
+        # so directories outside that prefix hold no match.
+        self.prefix = re.split(r'[*?\[]', pattern, 1)[0]
+
+    def __call__(self, visit):
+        return self.match(visit.entry.path) is not None
+
+    def may_match_below(self, path):
+        path += '/'
+        return path.startswith(self.prefix) or self.prefix.startswith(path)
+
+
+class Type(Predicate):
+    def __init__(self, file_type):
+        if file_type not in FILE_TYPES:
+            raise ValueError(f"Unknown file type '{file_type}' in find "
+                             "command")
+        self.file_type = file_type
+
+    def __call__(self, visit):
+        entry = visit.entry
+        if self.file_type == 'l':
+            return entry.is_symlink()
+        if self.file_type == 'd':
+            return entry.is_dir(follow_symlinks=False)
+        return entry.is_file(follow_symlinks=False)
+
+
+class Comparison(Predicate):
+    """Numeric test written as ``+N`` (more than), ``-N`` (less than) or
+    ``N`` (exactly).
+    """
+    needs_stat = True
+
+    def __init__(self, argument, option):
+        self.sign = argument[:1] if argument[:1] in '+-' else ''
+        self.argument = argument[len(self.sign):]
+        self.option = option
+
+    def compare(self, value, number):
+        if self.sign == '+':
+            return value > number
+        if self.sign == '-':
+            return value < number
+        return value == number
+
+    def invalid(self):
+        return ValueError(f"Invalid argument '{self.sign}{self.argument}' "
+                          f"to '{self.option}' in find command")
+
+
+class Size(Comparison):
+    def __init__(self, argument):
+        super().__init__(argument, '-size')
+        number, unit = self.argument, 'b'
+        if number[-1:] in SIZE_UNITS:
+            number, unit = number[:-1], number[-1]
+        if not number.isdigit():
+            raise self.invalid()
+        self.number, self.unit = int(number), SIZE_UNITS[unit]
+
+    def __call__(self, visit):
+        size = visit.entry.stat(follow_symlinks=False).st_size
+        return self.compare(math.ceil(size / self.unit), self.number)
+
+
+class Mtime(Comparison):
+    def __init__(self, argument, now):
+        super().__init__(argument, '-mtime')
+        if not self.argument.isdigit():
+            raise self.invalid()
+        self.number, self.now = int(self.argument), now
+
+    def __call__(self, visit):
+        mtime = visit.entry.stat(follow_symlinks=False).st_mtime
+        return self.compare(int((self.now - mtime) // 86400), self.number)
+
+
+class Newer(Predicate):
+    needs_stat = True
+
+    def __init__(self, reference):
+        self.mtime = os.stat(reference).st_mtime_ns
+
+    def __call__(self, visit):
+        return visit.entry.stat(follow_symlinks=False).st_mtime_ns \
+            > self.mtime
+
+
+class Prune(Predicate):
+    has_side_effects = True
+
+    def __call__(self, visit):
+        visit.pruned = True
+        return True
+
+
+class Print(Predicate):
+    has_side_effects = True
+
+    def __call__(self, visit):
+        visit.actions.append(self)
+        return True
+
+
+class Exec(Predicate):
+    """``-exec COMMAND ;`` or ``-exec COMMAND {} +``. Like ``Print``,
+    evaluating it only records the action on the visit; the caller runs
+    the command, one entry at a time or, with ``batched``, for many entries
+    at once.
+    """
+    has_side_effects = True
+
+    def __init__(self, command, batched):
+        self.command = command
+        self.batched = batched
+
+    def __call__(self, visit):
+        visit.actions.append(self)
+        return True
+
+    def arguments(self, paths):
+        if self.batched:
+            return self.command[1:-1] + list(paths)
+        path, = paths
+        return [argument.replace('{}', path)
+                for argument in self.command[1:]]
+
+
+PRINT = Print()
+
+
+class Not(Predicate):
+    def __init__(self, operand):
+        self.operand = operand
+        self.needs_stat = operand.needs_stat
+        self.has_side_effects = operand.has_side_effects
+
+    def __call__(self, visit):
+        return not self.operand(visit)
+
+    def contains(self, predicate_class):
+        return (isinstance(self, predicate_class)
+                or self.operand.contains(predicate_class))
+
+
+class Operator(Predicate):
+    def __init__(self, operands):
+        self.operands = self.reorder(operands)
+        self.needs_stat = any(operand.needs_stat for operand in operands)
+        self.has_side_effects = any(operand.has_side_effects
+                                    for operand in operands)
+
+    @staticmethod
+    def reorder(operands):
+        # Within each run of operands without side effects, the ones that
+        # need no stat call go first; short-circuiting then often avoids
+        # the stat call altogether.
+        ordered, run = [], []
+        for operand in operands:
+            if operand.has_side_effects:
+                ordered += sorted(run, key=lambda item: item.needs_stat)
+                ordered.append(operand)
+                run = []
+            else:
+                run.append(operand)
+        return ordered + sorted(run, key=lambda item: item.needs_stat)
+
+    def contains(self, predicate_class):
+        return (isinstance(self, predicate_class)
+                or any(operand.contains(predicate_class)
+                       for operand in self.operands))
+
+
+class And(Operator):
+    def __call__(self, visit):
+        return all(operand(visit) for operand in self.operands)
+
+    def may_match_below(self, path):
+        return all(operand.may_match_below(path)
+                   for operand in self.operands)
+
+
+class Or(Operator):
+    def __call__(self, visit):
+        return any(operand(visit) for operand in self.operands)
+
+    def may_match_below(self, path):
+        return any(operand.may_match_below(path)
+                   for operand in self.operands)
+
+
+class Always(Predicate):
+    def __call__(self, visit):
+        return True
+
+
+class FindExpression:
+    """A compiled ``find`` expression: the predicate tree together with
+    the depth limits. ``visit`` returns the actions (``Print`` or
+    ``Exec``) to perform on an entry, in order, and whether the walk
+    descends into it.
+    """
+
+    def __init__(self, predicate, min_depth=0, max_depth=None):
+        self.predicate = predicate
+        self.min_depth = min_depth
+        self.max_depth = max_depth
+        # Without explicit actions, the entries the expression is true
+        # for are printed.
+        self.implicit_print = not (predicate.contains(Print)
+                                   or predicate.contains(Exec))
+
+    def visit(self, entry, depth):
+        visit = Visit(entry, depth)
+        if depth >= self.min_depth:
+            if self.predicate(visit) and self.implicit_print:
+                visit.actions.append(PRINT)
+        descend = (not visit.pruned
+                   and (self.max_depth is None or depth < self.max_depth)
+                   and entry.is_dir(follow_symlinks=False)
+                   and self.predicate.may_match_below(entry.path))
+        return tuple(visit.actions), descend
+
+
+def compile_expression(tokens, now=None):
+    """Compile the expression part of a ``find`` command line into a
+    ``FindExpression``.
+
+    Operands are combined with ``-a`` (implied between adjacent tests),
+    ``-o`` and ``!``/``-not``, with parentheses for grouping. ``-maxdepth``
+    and ``-mindepth`` may appear anywhere and apply to the whole walk.
+    """
+    parser = ExpressionParser(tokens, time.time() if now is None else now)
+    predicate = parser.parse()
+    return FindExpression(predicate, parser.min_depth, parser.max_depth)
+
+
+class ExpressionParser:
+    def __init__(self, tokens, now):
+        self.tokens = list(tokens)
+        self.position = 0
+        self.now = now
+        self.min_depth = 0
+        self.max_depth = None
+
+    def parse(self):
+        if not self.tokens:
+            return Always()
+        predicate = self.parse_or()
+        if self.position < len(self.tokens):
+            raise ValueError(f"Unexpected '{self.tokens[self.position]}' "
+                             "in find command")
+        return predicate
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def argument(self, option):
+        if self.peek() is None:
+            raise ValueError(f"Missing argument to '{option}' in find "
+                             "command")
+        return self.take()
+
+    def parse_or(self):
+        operands = [self.parse_and()]
+        while self.peek() in ('-o', '-or'):
+            self.take()
+            operands.append(self.parse_and())
+        return operands[0] if len(operands) == 1 else Or(operands)
+
+    def parse_and(self):
+        operands = [self.parse_not()]
+        while self.peek() not in (None, '-o', '-or', ')'):
+            if self.peek() in ('-a', '-and'):
+                self.take()
+            operands.append(self.parse_not())
+        operands = [operand for operand in operands
+                    if not isinstance(operand, Always)] or [Always()]
+        return operands[0] if len(operands) == 1 else And(operands)
+
+    def parse_not(self):
+        if self.peek() in ('!', '-not'):
+            self.take()
+            return Not(self.parse_not())
+        return self.parse_primary()
+
+    def parse_primary(self):
+        token = self.take()
+        if token is None:
+            raise ValueError("Incomplete expression in find command")
+        if token == '(':
+            predicate = self.parse_or()
+            if self.take() != ')':
+                raise ValueError("Missing ')' in find command")
+            return predicate
+        if token == '-name':
+            pattern = self.argument(token)
+            if pattern.strip() == '':
+                raise ValueError("A search pattern must be provided.")
+            return Name(pattern)
+        if token == '-path':
+            return Path(self.argument(token))
+        if token == '-type':
+            return Type(self.argument(token))
+        if token == '-size':
+            return Size(self.argument(token))
+        if token == '-mtime':
+            return Mtime(self.argument(token), self.now)
+        if token == '-newer':
+            return Newer(self.argument(token))
+        if token == '-prune':
+            return Prune()
+        if token == '-print':
+            return Print()
+        if token == '-exec':
+            return self.parse_exec()
+        if token in ('-maxdepth', '-mindepth'):
+            value = self.argument(token)
+            if not value.isdigit():
+                raise ValueError(f"Invalid argument '{value}' to '{token}' "
+                                 "in find command")
+            if token == '-maxdepth':
+                self.max_depth = int(value)
+            else:
+                self.min_depth = int(value)
+            return Always()
+        raise ValueError(f"Unknown predicate '{token}' in find command")
+
+    def parse_exec(self):
+        # The command ends at ';' or, right after '{}', at '+'.
+        command = []
+        while True:
+            token = self.peek()
+            if token is None:
+                raise ValueError("Missing ';' or '+' after '-exec' "
+                                 "in find command")
+            self.take()
+            if token in (';', '\\;'):
+                batched = False
+                break
+            if token == '+' and command and command[-1] == '{}':
+                batched = True
+                break
+            command.append(token)
+        if not command or (batched and len(command) == 1):
+            raise ValueError("Missing command after '-exec' in find command")
+        return Exec(command, batched)
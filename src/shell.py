@@ -1,14 +1,77 @@
 from collections import deque
 from factory import ApplicationFactory
 from observer import Subject, CommandLogger
+from streams import Stream
 from glob import glob
 import sys
 import os
 import re
 import readline
+import threading
 from applications import History
 
 
+class ConsoleQueue(deque):
+    """Output queue that prints chunks as soon as they are produced, so
+    long-running commands such as ``tail -f`` are displayed while they run.
+    """
+
+    def append(self, chunk):
+        print(chunk, end="")
+        sys.stdout.flush()
+
+    def extend(self, chunks):
+        for chunk in chunks:
+            self.append(chunk)
+
+
+class FileQueue(deque):
+    """Output queue for ``> file`` redirection that writes chunks to the file
+    as they are produced, so ``tail -f file > out`` keeps ``out`` up to date.
+
+    The file is only opened on the first chunk (or once the command has
+    finished), so a command that fails creates no file and one reading the
+    file it redirects to still sees its contents.
+    """
+
+    def __init__(self, file_name):
+        super().__init__()
+        self.file_name = file_name
+        self.file = None
+        self.broken = False
+
+    def open(self):
+        if self.file is None and not self.broken:
+            try:
+                self.file = open(self.file_name, 'w')
+            except IOError as e:
+                self.fail(e)
+
+    def fail(self, error):
+        print(f"Error writing to file '{self.file_name}': {error}")
+        self.broken = True
+        self.close()
+
+    def append(self, chunk):
+        self.open()
+        if self.file is None:
+            return
+        try:
+            self.file.write(chunk)
+            self.file.flush()
+        except IOError as e:
+            self.fail(e)
+
+    def extend(self, chunks):
+        for chunk in chunks:
+            self.append(chunk)
+
+    def close(self):
+        if self.file is not None:
+            file, self.file = self.file, None
+            file.close()
+
+
 class CommandExecutor(Subject):
     def __init__(self):
         super().__init__()
@@ -17,12 +80,10 @@ class CommandExecutor(Subject):
 
     def execute_and_notify(self, command_line):
         self.command = command_line
-        output_queue = deque()
+        output_queue = ConsoleQueue()
         try:
             execute_command_line(command_line, output_queue)
             self.error = None
-            while output_queue:
-                print(output_queue.popleft(), end="")
         except ValueError as e:
             self.error = f"Syntax error: {e}"
         except FileNotFoundError as e:
@@ -49,16 +110,20 @@ def process_command(tokens, output_queue, input_data,
         app_instance = ApplicationFactory.create_application(app)
         if app_instance is None:
             raise ValueError(f"Command not found: {app}")
-        app_instance.exec(args, output_queue, input_data,
-                          input_redirection, output_redirection)
-
+        if (isinstance(input_data, Stream)
+                and not app_instance.streams_input):
+            input_data = input_data.read()
         if output_redirection:
+            app_output = FileQueue(output_redirection)
             try:
-                with open(output_redirection, 'w') as file:
-                    while output_queue:
-                        file.write(output_queue.popleft())
-            except IOError as e:
-                print(f"Error writing to file '{output_redirection}': {e}")
+                app_instance.exec(args, app_output, input_data,
+                                  input_redirection, output_redirection)
+                app_output.open()
+            finally:
+                app_output.close()
+        else:
+            app_instance.exec(args, output_queue, input_data,
+                              input_redirection, output_redirection)
     except ValueError as e:
         print(f"Error processing command '{app}': {e}")
 
@@ -78,15 +143,74 @@ def execute_command_line(command_line, output_queue, input_data=None):
                                    input_data, input_file)
 
 
+class PipelineStage(threading.Thread):
+    """Runs one command of a pipeline, writing its output into a stream
+    that the next command reads from concurrently."""
+
+    def __init__(self, command, output_stream, input_data):
+        super().__init__(daemon=True)
+        self.command = command
+        self.output_stream = output_stream
+        self.input_data = input_data
+        self.error = None
+
+    def run(self):
+        try:
+            execute_command_line(self.command, self.output_stream,
+                                 input_data=self.input_data)
+        except BrokenPipeError:
+            pass
+        except Exception as e:
+            # Once the next command has stopped reading, the write that
+            # failed may have been wrapped in another error by the
+            # application; the stage simply ends, like a UNIX pipe.
+            if not self.output_stream.broken:
+                self.error = e
+        finally:
+            self.output_stream.close()
+            if isinstance(self.input_data, Stream):
+                self.input_data.close_reader()
+
+
 def execute_piped_commands(piped_commands, output_queue):
 
-    output = None
-    for command in piped_commands:
-        sub_queue = deque()
-        execute_command_line(command.strip(), sub_queue, input_data=output)
-        output = ''.join(sub_queue)
-    if output:
-        output_queue.extend(output.splitlines(True))
+    stages = []
+    streams = []
+    input_data = None
+    for command in piped_commands[:-1]:
+        stream = Stream()
+        stage = PipelineStage(command.strip(), stream, input_data)
+        stage.start()
+        stages.append(stage)
+        streams.append(stream)
+        input_data = stream
+
+    error = None
+    interrupted = False
+    try:
+        execute_command_line(piped_commands[-1].strip(), output_queue,
+                             input_data=input_data)
+    except KeyboardInterrupt:
+        # Ctrl-C stops the whole pipeline, e.g. tail -f | grep, and
+        # returns to the prompt instead of leaving the shell.
+        interrupted = True
+    except Exception as e:
+        error = e
+    finally:
+        # Once the last command is done nothing can consume the output of
+        # the earlier ones, so break every pipe to stop endless producers.
+        for stream in streams:
+            stream.close_reader()
+
+    for stage in stages:
+        stage.join()
+    if interrupted:
+        return
+    for stage in stages:
+        if stage.error is not None:
+            raise stage.error
+    if error is not None:
+        raise error
 
 
 def split_command_line(command_line):
@@ -167,9 +291,7 @@ def main():
     if len(sys.argv) > 1:
         if len(sys.argv) != 3 or sys.argv[1] != "-c":
             raise ValueError("Invalid command line arguments")
-        execute_command_line(sys.argv[2], output_queue)
-        while output_queue:
-            print(output_queue.popleft(), end="")
+        execute_command_line(sys.argv[2], ConsoleQueue())
     else:
         command_executor = CommandExecutor()
         logger = CommandLogger()
@@ -0,0 +1,248 @@
+from concurrent.futures import ProcessPoolExecutor
+from heapq import merge, nlargest, nsmallest
+from itertools import groupby, islice, repeat
+import re
+import tempfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_BUFFER_SIZE = 256 * 1024 * 1024
+# Approximate memory taken by a line held in a list, on top of its text.
+LINE_OVERHEAD = 64
+MERGE_WIDTH = 16
+# Runs with fewer lines are not worth shipping to worker processes, or
+# converting to NumPy arrays.
+PARALLEL_THRESHOLD = 10000
+NUMPY_THRESHOLD = 10000
+
+NUMBER = re.compile(r'\s*(-?(?:\d+(?:\.\d*)?|\.\d+))')
+FIELD_START = re.compile(r'(?<=\S)(?=\s)')
+
+
+class SortKey:
+    """Computes the sort key of a line; ``list.sort`` calls it once per
+    line and sorts the lines by the keys (decorate-sort-undecorate).
+
+    ``fields`` lists ``(first, last)`` field ranges, 1-based, with
+    ``last`` ``None`` for the end of the line. Fields are separated by
+    ``separator``, or start where blanks follow non-blanks when it is
+    ``None``. Unless ``stable``, lines with equal keys are ordered by their
+    whole text.
+    """
+
+    def __init__(self, fields=(), separator=None, numeric=False,
+                 fold_case=False, stable=False):
+        self.fields = list(fields)
+        self.separator = separator
+        self.numeric = numeric
+        self.fold_case = fold_case
+        self.stable = stable
+
+    def __call__(self, line):
+        if self.fields:
+            keys = tuple(self.convert(self.field_text(line, first, last))
+                         for first, last in self.fields)
+        else:
+            keys = (self.convert(line),)
+        return keys if self.stable else (keys, line)
+
+    def field_text(self, line, first, last):
+        if self.separator is None:
+            return ''.join(FIELD_START.split(line, last or 0)[first - 1:last])
+        return self.separator.join(
+            line.split(self.separator, last or -1)[first - 1:last])
+
+    def convert(self, text):
+        if self.numeric:
+            return float(self.number_text(text))
+        return text.casefold() if self.fold_case else text
+
+    def number_text(self, text):
+        # Like POSIX sort -n, leading blanks are skipped and text that does
+        # not start with a number counts as zero.
+        match = NUMBER.match(text)
+        return match.group(1) if match else '0'
+
+    def uses_numpy(self, lines):
+        return (numpy is not None and self.numeric and len(self.fields) <= 1
+                and len(lines) >= NUMPY_THRESHOLD)
+
+    def argsort(self, lines, reverse):
+        """Sort ``lines`` in place by a single numeric key with NumPy: the
+        numbers are parsed and ordered in C rather than one ``float`` call
+        and one comparison of Python tuples at a time.
+        """
+        if not self.stable:
+            # Ties are broken by the whole line: sort by it first, then
+            # sort stably by the number.
+            lines.sort(reverse=reverse)
+        field = self.fields[0] if self.fields else None
+        texts = [self.number_text(self.field_text(line, *field)
+                                  if field else line) for line in lines]
+        values = numpy.array(texts).astype(numpy.float64)
+        order = numpy.argsort(-values if reverse else values, kind='stable')
+        lines[:] = [lines[index] for index in order.tolist()]
+
+
+def sort_lines(lines, key=None, reverse=False, unique=False,
+               buffer_size=DEFAULT_BUFFER_SIZE, temp_dir=None, parallel=1):
+    """Yield ``lines`` (without their newlines) in sorted order.
+
+    Lines are collected into runs of about ``buffer_size`` bytes. If the
+    input fits in one run it is sorted in memory; otherwise every run is
+    sorted and written to a temporary file in ``temp_dir``, and the runs
+    are merged, at most ``MERGE_WIDTH`` at a time, so the memory used does
+    not depend on the size of the input. With ``parallel`` above 1, large
+    runs are sorted by that many worker processes. ``key`` is a
+    ``SortKey`` or ``None`` to compare whole lines. With ``unique``, only
+    the first of the lines with equal keys is kept; duplicates are dropped
+    from each run as soon as it is sorted and again while merging, so they
+    are never written out or merged twice.
+    """
+    runs = []
+    pool = ProcessPoolExecutor(parallel) if parallel > 1 else None
+    try:
+        for run in read_runs(lines, buffer_size):
+            sort_run(run, key, reverse, pool, parallel)
+            if unique:
+                run[:] = first_of_each(run, key)
+            if not runs and run.complete:
+                yield from run
+                return
+            runs.append(write_run(run, temp_dir))
+        while len(runs) > MERGE_WIDTH:
+            # The merged run takes the place of the runs it replaces, so
+            # the runs stay in input order and ties keep the first line.
+            merged = write_run(merge_runs(runs[:MERGE_WIDTH], key, reverse,
+                                          unique), temp_dir)
+            for run in runs[:MERGE_WIDTH]:
+                run.close()
+            runs[:MERGE_WIDTH] = [merged]
+        yield from merge_runs(runs, key, reverse, unique)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        for run in runs:
+            run.close()
+
+
+def top_lines(lines, count, key=None, reverse=False, unique=False):
+    """Return the first ``count`` lines ``sort_lines`` would yield, keeping
+    no more than about ``count`` lines in memory at a time.
+    """
+    if not unique:
+        select = nlargest if reverse else nsmallest
+        return select(count, lines, key=key)
+    # The best distinct lines so far are kept ahead of each new batch, so
+    # among lines with equal keys the earliest one wins.
+    best = []
+    lines = iter(lines)
+    batch_size = max(count, 1024)
+    while count:
+        batch = list(islice(lines, batch_size))
+        if not batch:
+            break
+        best += batch
+        best.sort(key=key, reverse=reverse)
+        best = list(islice(first_of_each(best, key), count))
+    return best[:count]
+
+
+def first_of_each(lines, key):
+    # ``lines`` are sorted, so lines with equal keys are adjacent.
+    return (next(group) for _, group in groupby(lines, key))
+
+
+def merge_runs(runs, key, reverse, unique):
+    # ``merge`` takes equal lines from the earlier runs first, which keeps
+    # the order of the input.
+    merged = merge(*(read_run(run) for run in runs), key=key,
+                   reverse=reverse)
+    return first_of_each(merged, key) if unique else merged
+
+
+def sort_in_memory(lines, key, reverse):
+    if key is not None and key.uses_numpy(lines):
+        key.argsort(lines, reverse)
+    else:
+        lines.sort(key=key, reverse=reverse)
+
+
+def sort_run(run, key, reverse, pool, parallel):
+    """Sort ``run`` in place, splitting it between the worker processes of
+    ``pool`` when it is large enough.
+
+    Each worker receives its partition as one UTF-8 buffer rather than a
+    pickled list. Without a key it sorts the lines as bytes, which orders
+    them exactly as sorting the strings would, so the result does not
+    depend on ``parallel``.
+    """
+    if pool is None or len(run) < PARALLEL_THRESHOLD:
+        sort_in_memory(run, key, reverse)
+        return
+    size = -(-len(run) // parallel)
+    buffers = [encode_lines(run[start:start + size])
+               for start in range(0, len(run), size)]
+    partitions = [decode_lines(buffer) for buffer in
+                  pool.map(sort_buffer, buffers, repeat(key),
+                           repeat(reverse))]
+    run[:] = merge(*partitions, key=key, reverse=reverse)
+
+
+def sort_buffer(buffer, key, reverse):
+    if key is None:
+        lines = buffer.split(b'\n')
+        lines.pop()
+        lines.sort(reverse=reverse)
+        lines.append(b'')
+        return b'\n'.join(lines)
+    lines = decode_lines(buffer)
+    sort_in_memory(lines, key, reverse)
+    return encode_lines(lines)
+
+
+def encode_lines(lines):
+    return ''.join([line + '\n' for line in lines]).encode(
+        'utf-8', 'surrogateescape')
+
+
+def decode_lines(buffer):
+    lines = buffer.decode('utf-8', 'surrogateescape').split('\n')
+    lines.pop()
+    return lines
+
+
+class Run(list):
+    # ``complete`` is set on the last run read from the input.
+    complete = False
+
+
+def read_runs(lines, buffer_size):
+    lines = iter(lines)
+    while True:
+        run, size = Run(), 0
+        for line in lines:
+            run.append(line)
+            size += len(line) + LINE_OVERHEAD
+            if size >= buffer_size:
+                break
+        else:
+            run.complete = True
+            yield run
+            return
+        yield run
+
+
+def write_run(lines, temp_dir):
+    run = tempfile.TemporaryFile('w+', dir=temp_dir, encoding='utf-8',
+                                 errors='surrogateescape', newline='\n')
+    run.writelines(line + '\n' for line in lines)
+    return run
+
+
+def read_run(run):
+    run.seek(0)
+    return (line[:-1] for line in run)
@@ -0,0 +1,72 @@
+from collections import deque
+import threading
+
+
+class Stream:
+    """A bounded, thread-safe channel between two pipeline stages.
+
+    The writing stage uses it like an output queue (``append``/``extend``),
+    the reading stage iterates over it line by line while the writer is
+    still running. When the reader stops early, further writes raise
+    ``BrokenPipeError`` so that endless producers such as ``tail -f``
+    terminate, just like a UNIX pipe.
+    """
+
+    def __init__(self, max_chunks=1024):
+        self._chunks = deque()
+        self._max_chunks = max_chunks
+        self._condition = threading.Condition()
+        self.closed = False
+        self.broken = False
+
+    def append(self, chunk):
+        with self._condition:
+            while (len(self._chunks) >= self._max_chunks
+                   and not self.broken):
+                self._condition.wait()
+            if self.broken:
+                raise BrokenPipeError("Pipe closed by the reading command")
+            self._chunks.append(chunk)
+            self._condition.notify_all()
+
+    def extend(self, chunks):
+        for chunk in chunks:
+            self.append(chunk)
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def close_reader(self):
+        with self._condition:
+            self.broken = True
+            self._chunks.clear()
+            self._condition.notify_all()
+
+    def chunks(self):
+        while True:
+            with self._condition:
+                while not self._chunks and not self.closed:
+                    self._condition.wait()
+                if not self._chunks:
+                    return
+                chunk = self._chunks.popleft()
+                self._condition.notify_all()
+            yield chunk
+
+    def __iter__(self):
+        pending = ''
+        for chunk in self.chunks():
+            if '\n' not in chunk:
+                pending += chunk
+                continue
+            lines = (pending + chunk).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        if pending:
+            yield pending
+
+    def read(self):
+        return ''.join(self.chunks())
@@ -0,0 +1,171 @@
+import codecs
+import ctypes
+import os
+import select
+import sys
+import time
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+DIRECTORY_EVENTS = (IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO
+                    | IN_CREATE | IN_DELETE)
+
+
+class PollingWatcher:
+    """Waits for file changes by sleeping between stat checks.
+
+    The interval doubles every time nothing changed, up to
+    ``max_interval``, and drops back to the minimum once data arrives, so
+    idle files cost almost nothing while busy files are followed closely.
+    """
+
+    def __init__(self, min_interval=0.05, max_interval=1.0):
+        self.min_interval = min(min_interval, max_interval)
+        self.max_interval = max_interval
+        self.interval = self.min_interval
+
+    def wait(self):
+        time.sleep(self.interval)
+        self.interval = min(self.interval * 2, self.max_interval)
+
+    def reset(self):
+        self.interval = self.min_interval
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Blocks on Linux inotify events for the directories of the followed
+    files. Watching the directories rather than the files keeps working
+    when a file is rotated or recreated. ``timeout`` bounds each wait so the
+    caller can still notice when its reader went away.
+    """
+
+    def __init__(self, paths, timeout=1.0):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify is only available on Linux")
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            inotify_init1 = libc.inotify_init1
+            self.add_watch = libc.inotify_add_watch
+        except (OSError, AttributeError) as e:
+            raise OSError(f"inotify is not available: {e}")
+        self.fd = inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.timeout = timeout
+        directories = {os.path.dirname(os.path.abspath(path))
+                       for path in paths}
+        watches = [self.add_watch(self.fd, os.fsencode(directory),
+                                  DIRECTORY_EVENTS)
+                   for directory in directories]
+        if not any(watch >= 0 for watch in watches):
+            self.close()
+            raise OSError("No directory could be watched with inotify")
+
+    def wait(self):
+        ready, _, _ = select.select([self.fd], [], [], self.timeout)
+        if ready:
+            try:
+                while os.read(self.fd, 65536):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def reset(self):
+        pass
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def create_watcher(paths, max_interval=1.0):
+    try:
+        return InotifyWatcher(paths, timeout=max_interval)
+    except OSError:
+        return PollingWatcher(max_interval=max_interval)
+
+
+class FollowedFile:
+    """Tracks the read position of a file that is being followed.
+
+    With ``follow_name`` the file is reopened by name whenever it is
+    replaced (log rotation) and may be missing for a while; otherwise the
+    originally opened file is followed. In both modes a file that shrinks
+    is treated as truncated and read again from the start.
+    """
+
+    def __init__(self, path, follow_name=False):
+        self.path = path
+        self.follow_name = follow_name
+        self.file = None
+        self.identity = None
+        self.position = 0
+        self.decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        try:
+            self.open()
+        except FileNotFoundError:
+            if not follow_name:
+                raise
+
+    def open(self):
+        self.file = open(self.path, 'rb')
+        stat = os.fstat(self.file.fileno())
+        self.identity = (stat.st_dev, stat.st_ino)
+        self.position = 0
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def read_last_lines(self, num_lines, block_size=8192):
+        if self.file is None:
+            return ''
+        end = self.file.seek(0, os.SEEK_END)
+        self.position = end
+        if num_lines <= 0:
+            return ''
+        start, data = end, b''
+        while start > 0 and data.count(b'\n') <= num_lines:
+            step = min(block_size, start)
+            start -= step
+            self.file.seek(start)
+            data = self.file.read(step) + data
+        lines = data.splitlines(True)[-num_lines:]
+        return self.decoder.decode(b''.join(lines))
+
+    def read_new(self):
+        data = b''
+        if self.follow_name:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                stat = None
+            if stat is not None and (stat.st_dev,
+                                     stat.st_ino) != self.identity:
+                if self.file is not None:
+                    data = self.read_available()
+                    self.close()
+                try:
+                    self.open()
+                except FileNotFoundError:
+                    pass
+        if self.file is not None:
+            if os.fstat(self.file.fileno()).st_size < self.position:
+                self.position = 0
+            data += self.read_available()
+        return self.decoder.decode(data)
+
+    def read_available(self):
+        self.file.seek(self.position)
+        data = self.file.read()
+        self.position += len(data)
+        return data
@@ -3,9 +3,22 @@ import os
 # from shell import eval
 from collections import deque
 from shell import execute_command_line
+import shell
 from src.applications import Find, Mkdir, History, Rmdir, Remove, WordCount
+from applications import Cut, Grep, Locate, Sort, Uniq
+from filters import SeenLines
+from sorting import sort_lines, SortKey
+import sorting
+from predicates import And, compile_expression, Name, Path, Size
 import re
 import readline
+import threading
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class TestShell(unittest.TestCase):
@@ -18,6 +31,7 @@ class TestShell(unittest.TestCase):
         self.rmdir = Rmdir()
         self.remove = Remove()
         self.word_count = WordCount()
+        self.cut = Cut()
         # Create test_dir and change to it
         if not os.path.exists("test_dir"):
             os.mkdir("test_dir")
@@ -168,6 +182,146 @@ class TestShell(unittest.TestCase):
             self.assertEqual(line, expected_lines[i])
         os.remove('test.txt')  # Cleanup
 
+    def append_later(self, file_name, content, delay=0.2):
+        def append():
+            time.sleep(delay)
+            with open(file_name, 'a') as f:
+                f.write(content)
+        appender = threading.Thread(target=append)
+        appender.start()
+        return appender
+
+    def test_tail_follow(self):
+        with open('test.log', 'w') as f:
+            f.write("old1\nold2\n")
+        appender = self.append_later('test.log', "ERROR new1\nnew2\n")
+        stdout = self.eval("tail -n 1 -s 0.1 -f test.log | head -n 3")
+        appender.join()
+        self.assertEqual(stdout, "old2\nERROR new1\nnew2\n")
+        os.remove('test.log')
+
+    def test_tail_follow_pipeline(self):
+        with open('test.log', 'w') as f:
+            f.write("ERROR old\n")
+        appender = self.append_later('test.log',
+                                     "info\nERROR new\nERROR last\n")
+        stdout = self.eval("tail -s 0.1 -f test.log | grep ERROR "
+                           "| head -n 3")
+        appender.join()
+        self.assertEqual(stdout, "ERROR old\nERROR new\nERROR last\n")
+        os.remove('test.log')
+
+    def test_pipeline_reader_stops_early(self):
+        with open('lg.txt', 'w') as f:
+            f.write("".join(f"{i:05d}\n" for i in range(3000)))
+        self.assertEqual(self.eval("sort lg.txt | head -n 1"), "00000\n")
+        self.assertEqual(self.eval("uniq lg.txt | head -n 1"), "00000\n")
+        self.assertEqual(self.eval("cat lg.txt | nosuch"), "")
+        self.assertEqual(self.eval("cat lg.txt | grep -A 1 00001 | head -n 1"),
+                         "00001\n")
+        os.remove('lg.txt')
+
+    def test_tail_follow_pipeline_interrupt(self):
+        with open('test.log', 'w') as f:
+            f.write("ERROR old\ninfo\n")
+
+        class InterruptingQueue(deque):
+            # Ctrl-C arrives once the first line has been output.
+            def append(self, chunk):
+                super().append(chunk)
+                raise KeyboardInterrupt
+
+            def extend(self, chunks):
+                for chunk in chunks:
+                    self.append(chunk)
+
+        out = InterruptingQueue()
+        threads = threading.active_count()
+        execute_command_line("tail -s 0.1 -f test.log | grep ERROR", out)
+        self.assertEqual(list(out), ["ERROR old\n"])
+        self.assertEqual(threading.active_count(), threads)
+        os.remove('test.log')
+
+    def test_tail_follow_redirected(self):
+        with open('test.log', 'w') as f:
+            f.write("old\n")
+        written = []
+
+        class CheckingFileQueue(shell.FileQueue):
+            # Records the file after every chunk; Ctrl-C after the second.
+            def append(self, chunk):
+                super().append(chunk)
+                with open(self.file_name) as f:
+                    written.append(f.read())
+                if len(written) == 2:
+                    raise KeyboardInterrupt
+
+        appender = self.append_later('test.log', "new\n")
+        file_queue, shell.FileQueue = shell.FileQueue, CheckingFileQueue
+        try:
+            self.eval("tail -s 0.1 -f test.log > out.log")
+        finally:
+            shell.FileQueue = file_queue
+        appender.join()
+        self.assertEqual(written, ["old\n", "old\nnew\n"])
+        os.remove('test.log')
+        os.remove('out.log')
+
+    def test_redirect_failed_command(self):
+        self.eval("sort -k x nosuch.txt > out.txt")
+        self.assertFalse(os.path.exists('out.txt'))
+        with open('test.txt', 'w') as f:
+            f.write("b\na\n")
+        self.eval("sort test.txt > test.txt")
+        self.assertEqual(self.eval("cat test.txt"), "a\nb\n")
+        os.remove('test.txt')
+
+    def test_tail_follow_multiple_files(self):
+        with open('a.log', 'w') as fa, open('b.log', 'w') as fb:
+            fa.write("a1\n")
+            fb.write("b1\n")
+        appender = self.append_later('a.log', "a2\n")
+        stdout = self.eval("tail -s 0.1 -f a.log b.log | head -n 8")
+        appender.join()
+        self.assertEqual(stdout, "==> a.log <==\na1\n\n==> b.log <==\n"
+                                 "b1\n\n==> a.log <==\na2\n")
+        os.remove('a.log')
+        os.remove('b.log')
+
+    def test_tail_follow_truncation(self):
+        with open('test.log', 'w') as f:
+            f.write("a long line before truncation\n")
+
+        def truncate():
+            time.sleep(0.2)
+            with open('test.log', 'w') as f:
+                f.write("fresh\n")
+        truncator = threading.Thread(target=truncate)
+        truncator.start()
+        stdout = self.eval("tail -s 0.1 -f test.log | head -n 2")
+        truncator.join()
+        self.assertEqual(stdout, "a long line before truncation\nfresh\n")
+        os.remove('test.log')
+
+    def test_tail_follow_name_rotation(self):
+        with open('test.log', 'w') as f:
+            f.write("before\n")
+
+        def rotate():
+            time.sleep(0.2)
+            with open('test.log', 'a') as f:
+                f.write("last\n")
+            os.rename('test.log', 'test.log.1')
+            with open('test.log', 'w') as f:
+                f.write("after\n")
+        rotator = threading.Thread(target=rotate)
+        rotator.start()
+        stdout = self.eval("tail -s 0.1 -F test.log | head -n 3")
+        rotator.join()
+        self.assertEqual(stdout, "before\nlast\nafter\n")
+        os.remove('test.log')
+        os.remove('test.log.1')
+
     def test_grep(self):
         with open('test.txt', 'w') as f:
             f.write('test_content1\n')
@@ -208,6 +362,60 @@ class TestShell(unittest.TestCase):
         self.assertEqual(lines[1], 'demo')
         os.remove('test_uniq.txt')  # Cleanup
 
+    def test_uniq_counts_and_filters(self):
+        with open('test_uniq.txt', 'w') as f:
+            f.write("a 1 x\nb 1 x\nb 2 y\nC\nc\nc\nd")
+        cases = {
+            "uniq -c test_uniq.txt": "      1 a 1 x\n      1 b 1 x\n"
+                                     "      1 b 2 y\n      1 C\n"
+                                     "      2 c\n      1 d\n",
+            "uniq -ic test_uniq.txt": "      1 a 1 x\n      1 b 1 x\n"
+                                      "      1 b 2 y\n      3 C\n"
+                                      "      1 d\n",
+            "uniq -d -i test_uniq.txt": "C\n",
+            "uniq -u test_uniq.txt": "a 1 x\nb 1 x\nb 2 y\nC\nd\n",
+            "uniq -f 1 test_uniq.txt": "a 1 x\nb 2 y\nC\n",
+            "uniq -s 2 -c test_uniq.txt": "      2 a 1 x\n      1 b 2 y\n"
+                                          "      4 C\n",
+            "cat test_uniq.txt | uniq -iu": "a 1 x\nb 1 x\nb 2 y\nd\n",
+        }
+        for cmdline, expected in cases.items():
+            with self.subTest(cmdline=cmdline):
+                self.assertEqual(self.eval(cmdline), expected)
+        os.remove('test_uniq.txt')
+
+    def test_uniq_casefold_key(self):
+        uniq = Uniq()
+        uniq.exec(["-i"], self.out, "Straße\nSTRASSE\nstrasse\n", None,
+                  None)
+        self.assertEqual("".join(self.out), "Straße\n")
+        with self.assertRaises(ValueError):
+            uniq.exec(["-f", "x"], self.out, "a\n", None, None)
+
+    def test_uniq_global(self):
+        with open('test_uniq.txt', 'w') as f:
+            f.write("b\na\nB\nb\nc\na\n")
+        self.assertEqual(self.eval("uniq --global test_uniq.txt"),
+                         "b\na\nB\nc\n")
+        self.assertEqual(self.eval("cat test_uniq.txt | uniq --global -i "
+                                   "--memory=1K"), "b\na\nc\n")
+        with self.assertRaises(ValueError):
+            Uniq().exec(["--global", "-c"], self.out, "a\n", None, None)
+        with self.assertRaises(ValueError):
+            Uniq().exec(["--false-positive-rate", "2"], self.out, "a\n",
+                        None, None)
+        os.remove('test_uniq.txt')
+
+    def test_uniq_global_bloom_filter(self):
+        seen = SeenLines(memory_limit=640, error_rate=0.01)
+        self.assertEqual([seen.add(str(i)) for i in range(10)], [True] * 10)
+        self.assertIsNone(seen.bloom_filter)
+        self.assertTrue(seen.add("10"))
+        self.assertIsNotNone(seen.bloom_filter)
+        self.assertFalse(any(seen.add(str(i)) for i in range(11)))
+        new = sum(seen.add(f"line {i}") for i in range(200))
+        self.assertGreater(new, 190)
+
     def test_io_redirection(self):
         cmdline = "echo test > test.txt"
         self.eval(cmdline)
@@ -240,6 +448,99 @@ class TestShell(unittest.TestCase):
         result = stdout.strip()
         self.assertEqual(result, "abc")
 
+    def test_cut_overlapping_ranges(self):
+        with open('test_cut.txt', 'w') as f:
+            f.write("abcdefgh\n123\n")
+        stdout = self.eval("cut -b 6-,2-3,1,3-4 test_cut.txt")
+        self.assertEqual(stdout, "abcdfgh\n123\n")
+        os.remove('test_cut.txt')
+
+    def test_cut_bytes(self):
+        stdout = self.eval("echo héllo | cut -b 1,4-")
+        self.assertEqual(stdout, "hllo\n")
+
+    def test_cut_invalid_range(self):
+        with self.assertRaises(ValueError):
+            self.cut.exec(["-b", "0-2"], self.out, "abc", None, None)
+        with self.assertRaises(ValueError):
+            self.cut.exec(["-b", "3-1"], self.out, "abc", None, None)
+
+    def test_cut_fields(self):
+        with open('test_cut.csv', 'w') as f:
+            f.write("a,b,c,d,e,f\nno delimiter\nx,y\n")
+        stdout = self.eval("cut -d , -f 5-,1,3-4 test_cut.csv")
+        self.assertEqual(stdout, "a,c,d,e,f\nno delimiter\nx\n")
+        stdout = self.eval("cat test_cut.csv | cut -d , -f 2-3 "
+                           "--output-delimiter=:")
+        self.assertEqual(stdout, "b:c\nno delimiter\ny\n")
+        os.remove('test_cut.csv')
+
+    def test_cut_fields_tab_default(self):
+        self.cut.exec(["-f", "2"], self.out, "a\tb\tc\n", None, None)
+        self.assertEqual("".join(self.out), "b\n")
+
+    def test_cut_invalid_options(self):
+        with self.assertRaises(ValueError):
+            self.cut.exec(["-b", "1", "-f", "1"], self.out, "a", None, None)
+        with self.assertRaises(ValueError):
+            self.cut.exec(["-d", "::", "-f", "1"], self.out, "a", None, None)
+        with self.assertRaises(ValueError):
+            self.cut.exec(["-d", ",", "-b", "1"], self.out, "a", None, None)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_cut_fixed_width(self):
+        with open('test_cut.txt', 'w') as f:
+            f.write("".join(f"{i:04d}abcdef\n" for i in range(1000)))
+        stdout = self.eval("cut -b 3-4,9-,7 --fixed-width test_cut.txt")
+        self.assertEqual(stdout, "".join(f"{i:04d}"[2:] + "cef\n"
+                                         for i in range(1000)))
+        self.cut.fixed_width_threshold = 0
+        self.cut.exec(["-b", "-2", "test_cut.txt"], self.out, "", None, None)
+        self.assertEqual("".join(self.out), "".join(
+            f"{i:04d}"[:2] + "\n" for i in range(1000)))
+        os.remove('test_cut.txt')
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_cut_fixed_width_uneven_block(self):
+        # The last two lines together are as long as one line of the rest.
+        lines = [f"{i:04d}abcdef" for i in range(50)] + ["short", "xxxx"]
+        with open('test_cut.txt', 'w') as f:
+            f.write("".join(line + "\n" for line in lines))
+        self.cut.fixed_width_threshold = 0
+        self.cut.fixed_width_block = 8
+        self.cut.exec(["-b", "2-3", "test_cut.txt"], self.out, "", None,
+                      None)
+        self.assertEqual("".join(self.out),
+                         "".join(line[1:3] + "\n" for line in lines))
+        # Blocks before the uneven one are still cut as arrays.
+        self.assertEqual(self.out[0],
+                         "".join(line[1:3] + "\n" for line in lines[:8]))
+        with self.assertRaises(ValueError):
+            self.cut.exec(["-b", "1", "--fixed-width", "test_cut.txt"],
+                          deque(), "", None, None)
+        os.remove('test_cut.txt')
+
+    @unittest.skipIf(numpy is not None, "numpy is installed")
+    def test_cut_fixed_width_without_numpy(self):
+        with open('test_cut.txt', 'w') as f:
+            f.write("abc\n")
+        with self.assertRaises(ValueError):
+            self.cut.exec(["-b", "1", "--fixed-width", "test_cut.txt"],
+                          self.out, "", None, None)
+        os.remove('test_cut.txt')
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_cut_fixed_width_uneven_lines(self):
+        with open('test_cut.txt', 'w') as f:
+            f.write("abcdef\nab\nabc\n")
+        with self.assertRaises(ValueError):
+            self.cut.exec(["-b", "1", "--fixed-width", "test_cut.txt"],
+                          self.out, "", None, None)
+        self.cut.fixed_width_threshold = 0
+        self.cut.exec(["-b", "1", "test_cut.txt"], self.out, "", None, None)
+        self.assertEqual("".join(self.out), "a\na\na\n")
+        os.remove('test_cut.txt')
+
     def test_disabled_doublequotes(self):
         cmdline = "echo '\"\"'"
         stdout = self.eval(cmdline)
@@ -393,6 +694,57 @@ class TestShell(unittest.TestCase):
         self.assertFalse(os.path.exists("file1.txt"))
         self.assertFalse(os.path.exists("file2.txt"))
 
+    def test_rm_recursive(self):
+        for sub in ('a', 'b/c', 'b/d', 'e'):
+            os.makedirs(os.path.join('tree', sub))
+        for name in ('top.txt', 'a/1.txt', 'b/c/2.txt', 'b/d/3.txt',
+                     'e/.hidden'):
+            open(os.path.join('tree', name), 'w').close()
+        os.symlink(os.path.abspath('dir1'), 'tree/link')
+        stdout = self.eval("rm -rv tree")
+        self.assertFalse(os.path.lexists('tree'))
+        self.assertTrue(os.path.exists('dir1/file3.txt'))
+        self.assertEqual(len(stdout.splitlines()), 12)
+        self.assertIn("removed directory 'tree/b/c'\n", stdout)
+        self.assertTrue(stdout.endswith("removed directory 'tree'\n"))
+        self.assertEqual(self.eval("rm -f missing.txt"), "")
+        with self.assertRaises(Exception):
+            self.remove.exec(["dir2"], self.out, None, None, None)
+        with self.assertRaises(Exception):
+            self.remove.exec(["-r", "."], self.out, None, None, None)
+        self.assertTrue(os.path.exists('dir2'))
+
+    def test_rm_recursive_single_child_chain(self):
+        for sub in ('a', 'b', 'c', 'd'):
+            os.makedirs(os.path.join('build/lib', sub, 'deep'))
+            open(os.path.join('build/lib', sub, 'deep', 'f'), 'w').close()
+        tasks, local = set(), threading.local()
+
+        class RecordingRemove(Remove):
+            # Records the subtrees removed by separate pool tasks.
+            def remove_subdirectory(self, parent_fd, name, *args):
+                depth = getattr(local, 'depth', 0)
+                if depth == 0:
+                    tasks.add(name)
+                local.depth = depth + 1
+                try:
+                    super().remove_subdirectory(parent_fd, name, *args)
+                finally:
+                    local.depth = depth
+
+        out = deque()
+        remove = RecordingRemove()
+        remove.max_workers = 2
+        remove.exec(["-rv", "build"], out, None, None, None)
+        self.assertFalse(os.path.lexists('build'))
+        self.assertEqual(len(out), 14)
+        self.assertEqual(out[-1], "removed directory 'build'\n")
+        self.assertEqual(tasks, {'a', 'b', 'c', 'd'})
+        for path in ("/", "//", ".", "a/..", "/.."):
+            with self.subTest(path=path):
+                self.assertTrue(Remove.is_protected(path))
+        self.assertFalse(Remove.is_protected("dir1"))
+
     def test_wc(self):
         cmdline = "wc -l dir1/file3.txt"
         result = self.eval(cmdline).strip()
@@ -408,7 +760,8 @@ class TestShell(unittest.TestCase):
     def test_wc_multiple_files(self):
         cmdline = "wc -l dir1/file3.txt dir2/file.txt"
         result = self.eval(cmdline).strip().split('\n')
-        expected_output = ["4 dir1/file3.txt", "3 dir2/file.txt"]
+        expected_output = ["4 dir1/file3.txt", "3 dir2/file.txt",
+                           "7 total"]
         self.assertEqual(result, expected_output)
 
     def test_cd_nonexistent_directory(self):
@@ -444,6 +797,30 @@ class TestShell(unittest.TestCase):
         with self.assertRaises(ValueError):
             self.eval(cmdline)
 
+    def test_ls_options(self):
+        os.makedirs('ls_dir/sub/deep')
+        with open('ls_dir/big', 'w') as f:
+            f.write('x' * 100)
+        with open('ls_dir/.hidden', 'w') as f:
+            f.write('x')
+        open('ls_dir/small', 'w').close()
+        open('ls_dir/sub/deep/leaf', 'w').close()
+        os.utime('ls_dir/small', (1000000000, 1000000000))
+        self.assertEqual(sorted(self.eval("ls ls_dir").split()),
+                         ["big", "small", "sub"])
+        self.assertEqual(sorted(self.eval("ls -a1 ls_dir").split()),
+                         [".hidden", "big", "small", "sub"])
+        self.assertEqual(self.eval("ls -S ls_dir").split()[-2:],
+                         ["big", "small"])
+        self.assertEqual(self.eval("ls -t ls_dir").split()[-1], "small")
+        self.assertEqual(self.eval("ls -R ls_dir/sub"),
+                         "ls_dir/sub:\ndeep\n\nls_dir/sub/deep:\nleaf\n")
+        fields = self.eval("ls -l ls_dir/big").split()
+        self.assertTrue(fields[0].startswith("-rw"))
+        self.assertEqual(fields[4], "100")
+        self.assertEqual(fields[-1], "ls_dir/big")
+        self.assertIn(" 2001 small\n", self.eval("ls -l ls_dir"))
+
     def test_ls_invalid_format(self):
         cmdline = "ls dir1 dir2"
         with self.assertRaises(ValueError):
@@ -510,6 +887,482 @@ class TestShell(unittest.TestCase):
         self.assertEqual(stdout.strip(), "123")
         os.remove('test_grep.txt')
 
+    def test_grep_fixed_string(self):
+        with open('test_grep.txt', 'w') as f:
+            f.write("a.b\naxb\n")
+        stdout = self.eval("grep -F 'a.b' test_grep.txt")
+        self.assertEqual(stdout, "a.b\n")
+        os.remove('test_grep.txt')
+
+    def test_grep_ignore_case_invert(self):
+        with open('test_grep.txt', 'w') as f:
+            f.write("Error one\nok\nERROR two\n")
+        self.assertEqual(self.eval("grep -i error test_grep.txt"),
+                         "Error one\nERROR two\n")
+        self.assertEqual(self.eval("grep -iv 'err.r' test_grep.txt"), "ok\n")
+        os.remove('test_grep.txt')
+
+    def test_grep_whole_word(self):
+        with open('test_grep.txt', 'w') as f:
+            f.write("cat\ncatalog\nthe cat sat\nbobcat\n")
+        self.assertEqual(self.eval("grep -w cat test_grep.txt"),
+                         "cat\nthe cat sat\n")
+        self.assertEqual(self.eval("grep -w 'c.t' test_grep.txt"),
+                         "cat\nthe cat sat\n")
+        self.assertEqual(self.eval("grep -wi CAT test_grep.txt"),
+                         "cat\nthe cat sat\n")
+        os.remove('test_grep.txt')
+
+    def test_grep_matcher_cache(self):
+        from matchers import compile_matcher
+        self.assertIs(compile_matcher("abc", ignore_case=True),
+                      compile_matcher("abc", ignore_case=True))
+
+    def test_grep_pattern_file(self):
+        with open('patterns.txt', 'w') as f:
+            f.write("he\nshe\nhis\nhers\nuser-[0-9]+\n")
+        with open('test_grep.txt', 'w') as f:
+            f.write("ushers\nnothing\nhi\nuser-42 logged in\nahis\n")
+        stdout = self.eval("grep -f patterns.txt test_grep.txt")
+        self.assertEqual(stdout, "ushers\nuser-42 logged in\nahis\n")
+        os.remove('patterns.txt')
+        os.remove('test_grep.txt')
+
+    def test_grep_multiple_e_patterns(self):
+        stdout = self.eval("cat dir1/file3.txt dir1/file4.txt "
+                           "| grep -e bbb -e ddd -e 'c+'")
+        self.assertEqual(stdout, "ccc\nbbb\nddd\n")
+
+    def test_grep_fixed_strings_whole_word(self):
+        with open('test_grep.txt', 'w') as f:
+            f.write("the id42 here\nid421\nID7\n")
+        stdout = self.eval("grep -Fwi -e id42 -e id7 test_grep.txt")
+        self.assertEqual(stdout, "the id42 here\nID7\n")
+        os.remove('test_grep.txt')
+
+    def test_aho_corasick(self):
+        from matchers import AhoCorasick
+        automaton = AhoCorasick(["he", "she", "his", "hers"])
+        self.assertEqual(sorted(automaton.finditer("ushers")),
+                         [(1, 4), (2, 4), (2, 6)])
+        self.assertTrue(automaton.search("ahis"))
+        self.assertFalse(automaton.search("hi"))
+
+    def test_grep_parallel_files(self):
+        for i in range(20):
+            with open(f'log{i:02}.txt', 'w') as f:
+                f.write(f"ERROR {i}\nok\nERROR again {i}\n")
+        files = " ".join(f"log{i:02}.txt" for i in range(20))
+        expected = "".join(f"log{i:02}.txt:ERROR {i}\n"
+                           f"log{i:02}.txt:ERROR again {i}\n"
+                           for i in range(20))
+        self.assertEqual(self.eval(f"grep -j 4 ERROR {files}"), expected)
+        self.assertEqual(self.eval(f"grep -j 2 --processes ERROR {files}"),
+                         expected)
+        for i in range(20):
+            os.remove(f'log{i:02}.txt')
+
+    def test_grep_unsafe_worker_processes(self):
+        with open('a.log', 'w') as f:
+            f.write("ERROR 1\nok\n" * 50)
+        with open('b.log', 'w') as f:
+            f.write("ERROR 2\n")
+        self.assertEqual(self.eval("_grep -j 2 --processes ERROR b.log a.log"),
+                         "b.log:ERROR 2\n" + "a.log:ERROR 1\n" * 50)
+        threshold, Grep.mmap_threshold = Grep.mmap_threshold, 1
+        try:
+            self.assertEqual(self.eval("_grep -j 2 ERROR a.log"),
+                             "ERROR 1\n" * 50)
+        finally:
+            Grep.mmap_threshold = threshold
+        os.remove('a.log')
+        os.remove('b.log')
+
+    def test_grep_parallel_missing_file(self):
+        with self.assertRaises(IOError):
+            self.eval("grep -j 2 Content dir1/file1.txt missing.txt")
+
+    def test_grep_large_file_chunks(self):
+        with open('big.log', 'w') as f:
+            for i in range(2000):
+                f.write(f"line {i} {'ERROR' if i % 7 == 0 else 'ok'}\n")
+            f.write("ERROR without newline")
+        expected = self.eval("cat big.log | grep -i error")
+        grep = Grep()
+        grep.mmap_threshold = 1
+        for args in (["-i", "error", "big.log"],
+                     ["-j", "3", "-i", "error", "big.log"]):
+            out = deque()
+            grep.exec(args, out, None, None, None)
+            self.assertEqual("".join(out) + "\n", expected)
+        out = deque()
+        grep.exec(["-j", "3", "-w", r"[0-9]+\s+ok", "big.log"],
+                  out, None, None, None)
+        self.assertEqual(len(out), 2000 - 286)
+        os.remove('big.log')
+
+    def test_grep_recursive_skips_bad_entries(self):
+        self.make_search_tree()
+        with open('tree/src/latin1.txt', 'wb') as f:
+            f.write("TODO café\n".encode('latin-1'))
+        os.makedirs('tree/locked')
+        with open('tree/locked/f.log', 'w') as f:
+            f.write("TODO locked\n")
+        os.chmod('tree/locked', 0)
+        try:
+            stdout = self.eval("grep -r TODO tree")
+        finally:
+            os.chmod('tree/locked', 0o755)
+        self.assertIn("tree/src/latin1.txt:TODO caf\ufffd\n", stdout)
+        self.assertIn("tree/src/sub/c.log:TODO c\n", stdout)
+        if os.geteuid() != 0:
+            self.assertNotIn("locked", stdout)
+
+    def test_grep_recursive_large_files(self):
+        self.make_search_tree()
+        with open('tree/locked.log', 'w') as f:
+            f.write("TODO locked\n")
+        os.chmod('tree/locked.log', 0)
+        grep = Grep()
+        grep.mmap_threshold = 1
+        out = deque()
+        try:
+            grep.exec(["-r", "TODO", "tree"], out, None, None, None)
+        finally:
+            os.chmod('tree/locked.log', 0o644)
+        self.assertNotIn("tree/src/e.bin:TODO\0binary\n", out)
+        self.assertIn("tree/src/sub/c.log:TODO c\n", out)
+        if os.geteuid() != 0:
+            self.assertNotIn("tree/locked.log:TODO locked\n", out)
+
+    def test_grep_large_file_non_ascii(self):
+        with open('big.log', 'w', encoding='utf-8') as f:
+            f.write("aéb\ncafé au lait\nplain\nKELVIN \u212a\n")
+        grep = Grep()
+        grep.mmap_threshold = 1
+        for args in (["a.b"], [r"caf\w"], ["caf[^x] "], [r"caf\S"],
+                     [r"caf\xe9"], ["-i", "kelvin k"],
+                     ["-w", "caf"], ["-j", "2", "café"]):
+            with self.subTest(args=args):
+                out, lines = deque(), deque()
+                grep.exec(args + ["big.log"], out, None, None, None)
+                Grep().exec(args + ["big.log"], lines, None, None, None)
+                self.assertEqual(list(out), list(lines))
+                self.assertTrue(out or args == ["-w", "caf"])
+        os.remove('big.log')
+
+    def test_grep_large_file_empty_match(self):
+        with open('big.log', 'w') as f:
+            f.write("".join(f"line {i}\n" for i in range(50)) + "\n"
+                    + "".join(f"line {i}\n" for i in range(50)))
+        grep = Grep()
+        grep.mmap_threshold = 1
+        for args in (["^$"], ["^x*$"], ["-j", "4", "^$"], ["x*"]):
+            with self.subTest(args=args):
+                out, lines = deque(), deque()
+                grep.exec(args + ["big.log"], out, None, None, None)
+                Grep().exec(args + ["big.log"], lines, None, None, None)
+                self.assertEqual(list(out), list(lines))
+        os.remove('big.log')
+
+    def make_search_tree(self):
+        os.makedirs('tree/src/sub', exist_ok=True)
+        os.makedirs('tree/build', exist_ok=True)
+        files = {'tree/a.log': "TODO a\n", 'tree/src/b.py': "TODO b\n",
+                 'tree/src/sub/c.log': "nothing\nTODO c\n",
+                 'tree/build/d.log': "TODO d\n"}
+        for name, content in files.items():
+            with open(name, 'w') as f:
+                f.write(content)
+        with open('tree/src/e.bin', 'wb') as f:
+            f.write(b'TODO\0binary\n')
+
+    def test_grep_recursive(self):
+        self.make_search_tree()
+        stdout = self.eval("grep -r TODO tree")
+        self.assertEqual(stdout, "tree/a.log:TODO a\n"
+                                 "tree/build/d.log:TODO d\n"
+                                 "tree/src/b.py:TODO b\n"
+                                 "tree/src/sub/c.log:TODO c\n")
+
+    def test_grep_recursive_globs(self):
+        self.make_search_tree()
+        stdout = self.eval("grep -r --include='*.log' --exclude-dir build "
+                           "TODO tree")
+        self.assertEqual(stdout, "tree/a.log:TODO a\n"
+                                 "tree/src/sub/c.log:TODO c\n")
+        stdout = self.eval("grep -r -j 2 --exclude='*.log' TODO tree")
+        self.assertEqual(stdout, "tree/src/b.py:TODO b\n")
+
+    def test_grep_count_and_files_with_matches(self):
+        stdout = self.eval("grep -c aaa dir1/file3.txt dir1/file4.txt")
+        self.assertEqual(stdout, "dir1/file3.txt:2\ndir1/file4.txt:0\n")
+        self.assertEqual(self.eval("grep -vc aaa dir1/file3.txt"), "2\n")
+        stdout = self.eval("grep -l e dir1/file1.txt dir1/file3.txt "
+                           "dir1/file4.txt")
+        self.assertEqual(stdout, "dir1/file1.txt\ndir1/file4.txt\n")
+        stdout = self.eval("cat dir1/file3.txt | grep -l aaa")
+        self.assertEqual(stdout, "(standard input)\n")
+
+    def test_grep_max_count(self):
+        self.assertEqual(self.eval("grep -m 1 aaa dir1/file3.txt"), "aaa\n")
+        stdout = self.eval("cat dir1/file3.txt | grep -c -m 1 '[a-c]'")
+        self.assertEqual(stdout, "1\n")
+        self.assertEqual(self.eval("grep -m 0 aaa dir1/file3.txt"), "")
+
+    def test_grep_quiet(self):
+        self.assertEqual(self.eval("grep -q aaa dir1/file3.txt "
+                                   "nonexistent_file.txt"), "")
+        with self.assertRaises(IOError):
+            self.eval("grep -q zzz dir1/file3.txt nonexistent_file.txt")
+
+    def test_grep_context(self):
+        with open('test_grep.txt', 'w') as f:
+            f.write("".join(f"line{i}\n" for i in range(1, 11)))
+        stdout = self.eval("grep -B 1 -A 1 'line[38]' test_grep.txt")
+        self.assertEqual(stdout, "line2\nline3\nline4\n--\n"
+                                 "line7\nline8\nline9\n")
+        stdout = self.eval("grep -C 2 'line[35]' test_grep.txt")
+        self.assertEqual(stdout, "".join(f"line{i}\n" for i in range(1, 8)))
+        stdout = self.eval("grep -A 1 -m 1 line test_grep.txt")
+        self.assertEqual(stdout, "line1\nline2\n")
+        os.remove('test_grep.txt')
+
+    def test_grep_attached_option_values(self):
+        with open('test_grep.txt', 'w') as f:
+            f.write("".join(f"line{i}\n" for i in range(1, 11)))
+        for attached, separate in (("-A1", "-A 1"), ("-B1", "-B 1"),
+                                   ("-C2", "-C 2"), ("-m2", "-m 2"),
+                                   ("-j2", "-j 2"), ("-iC1", "-i -C 1")):
+            with self.subTest(option=attached):
+                self.assertEqual(
+                    self.eval(f"grep {attached} 'line[35]' test_grep.txt "
+                              "test_grep.txt"),
+                    self.eval(f"grep {separate} 'line[35]' test_grep.txt "
+                              "test_grep.txt"))
+        self.assertEqual(self.eval("grep -m1 line test_grep.txt"), "line1\n")
+        self.assertEqual(self.eval("grep -ieLINE5 test_grep.txt"), "line5\n")
+        with self.assertRaises(ValueError):
+            Grep().exec(["-Ax", "line", "test_grep.txt"], deque(),
+                        None, None, None)
+        os.remove('test_grep.txt')
+
+    def test_grep_context_multiple_files_and_stdin(self):
+        stdout = self.eval("grep -B 1 bbb dir1/file3.txt dir2/file.txt")
+        self.assertEqual(stdout, "dir1/file3.txt-ccc\ndir1/file3.txt:bbb\n"
+                                 "dir2/file.txt:bbb\n")
+        stdout = self.eval("cat dir1/file3.txt | grep -A 1 ccc")
+        self.assertEqual(stdout, "ccc\nbbb\n")
+
+    def test_index_build_and_grep(self):
+        self.make_search_tree()
+        stdout = self.eval("index build tree")
+        self.assertEqual(stdout, "Indexed 4 files in tree (5 read)\n")
+        self.assertEqual(self.eval("grep -r 'TODO [ab]' tree"),
+                         "tree/a.log:TODO a\ntree/src/b.py:TODO b\n")
+        with open('tree/build/d.log', 'a') as f:
+            f.write("added after indexing\n")
+        self.assertEqual(self.eval("grep -r 'after index' tree"),
+                         "tree/build/d.log:added after indexing\n")
+        self.assertEqual(self.eval("grep nothing tree/a.log "
+                                   "tree/src/sub/c.log"),
+                         "tree/src/sub/c.log:nothing\n")
+
+    def test_index_update(self):
+        self.make_search_tree()
+        self.eval("index build tree")
+        with open('tree/a.log', 'a') as f:
+            f.write("more\n")
+        stdout = self.eval("index update tree")
+        self.assertEqual(stdout, "Indexed 4 files in tree (1 read)\n")
+        from indexes import TrigramIndex
+        index = TrigramIndex('tree/.trigram-index')
+        self.assertEqual(index.candidates(("todo",)),
+                         {"a.log", "src/b.py", "src/sub/c.log",
+                          "build/d.log"})
+        self.assertEqual(index.candidates(("more",)), {"a.log"})
+        self.assertIsNone(index.candidates(("a|b",)))
+        index.close()
+
+    def test_index_required_literals(self):
+        from indexes import required_literals
+        self.assertEqual(required_literals(r"foo\.bar[0-9]+baz?x{2}(ab)*end"),
+                         ["foo.bar", "ba", "end"])
+        for pattern, literals in (
+                (r"\x41bcd", ["bcd"]), (r"\u0041bcd", ["bcd"]),
+                (r"\U00000041bcd", ["bcd"]),
+                (r"\N{LATIN CAPITAL LETTER A}bcd", ["bcd"]),
+                (r"\101bcd", ["bcd"]), (r"(ab)\1cd", ["cd"]),
+                (r"\wxyz", ["xyz"]), ("[]abc]def", ["def"]),
+                ("[^]abc]def", ["def"]), ("[]]x", ["x"])):
+            with self.subTest(pattern=pattern):
+                self.assertEqual(required_literals(pattern), literals)
+
+    def test_index_grep_escapes(self):
+        os.makedirs('corpus')
+        with open('corpus/a.txt', 'w') as f:
+            f.write("Abcdef\n")
+        self.eval("index build corpus")
+        for pattern in (r"\x41bcd", r"\101bcd",
+                        r"\N{LATIN CAPITAL LETTER A}b"):
+            with self.subTest(pattern=pattern):
+                self.assertEqual(self.eval(f"grep '{pattern}' corpus/a.txt"),
+                                 "Abcdef\n")
+
+    def test_locate(self):
+        self.make_search_tree()
+        stdout = self.eval("updatedb tree")
+        self.assertEqual(stdout, "Indexed 8 entries in tree (4 read)\n")
+        root = os.path.abspath('tree')
+        stdout = self.eval("locate -d tree/.locate-index '*.log'")
+        self.assertEqual(sorted(stdout.splitlines()),
+                         [os.path.join(root, path) for path in
+                          ("a.log", "build/d.log", "src/sub/c.log")])
+        os.chdir('tree/src')
+        try:
+            stdout = self.eval("locate '*/src/s*'")
+        finally:
+            os.chdir('../..')
+        self.assertEqual(stdout, os.path.join(root, "src/sub") + "\n"
+                         + os.path.join(root, "src/sub/c.log") + "\n")
+
+    def test_locate_brackets(self):
+        os.makedirs('names')
+        for name in ('adef', 'bdef', 'zdef', '*b', 'x]y'):
+            open(os.path.join('names', name), 'w').close()
+        self.eval("updatedb names")
+        root = os.path.abspath('names')
+        for pattern, expected in (("[abc]def", ["adef", "bdef"]),
+                                  ("[!a]def", ["bdef", "zdef"]),
+                                  ("*/names/[*]b", ["*b"]),
+                                  ("x[]]y", ["x]y"])):
+            with self.subTest(pattern=pattern):
+                out = deque()
+                Locate().exec(["-d", "names/.locate-index", pattern], out,
+                              None, None, None)
+                self.assertEqual(sorted("".join(out).splitlines()),
+                                 [os.path.join(root, name)
+                                  for name in expected])
+
+    def test_locate_refresh(self):
+        for i in range(40):
+            os.makedirs(f'names/dir{i:02d}/sub')
+        self.eval("updatedb names")
+        with open('names/dir33/new.txt', 'w') as f:
+            f.write("new\n")
+        os.rmdir('names/dir05/sub')
+        stdout = self.eval("updatedb names")
+        self.assertEqual(stdout, "Indexed 80 entries in names (3 read)\n")
+        root = os.path.abspath('names')
+        self.assertEqual(self.eval("locate -d names/.locate-index new.txt"),
+                         os.path.join(root, "dir33/new.txt") + "\n")
+        stdout = self.eval("locate -d names/.locate-index sub")
+        self.assertEqual(len(stdout.splitlines()), 39)
+        self.assertNotIn(os.path.join(root, "dir05/sub"), stdout)
+        with self.assertRaises(ValueError):
+            Locate().exec(["-d", "names/.locate-index", ""], self.out,
+                          None, None, None)
+
+    def test_find_sorted(self):
+        self.make_search_tree()
+        stdout = self.eval("find tree -name '*.log' --sorted")
+        self.assertEqual(stdout, "tree/a.log\ntree/build/d.log\n"
+                                 "tree/src/sub/c.log\n")
+        stdout = self.eval("find tree -name '*.log'")
+        self.assertEqual(sorted(stdout.splitlines()),
+                         ["tree/a.log", "tree/build/d.log",
+                          "tree/src/sub/c.log"])
+
+    def test_find_streams_results(self):
+        self.make_search_tree()
+        self.find.max_workers = 1
+        found = self.find.find_files(
+            "tree", compile_expression(["-name", "*.log"]), True)
+        self.assertEqual(next(found)[0], "tree/a.log")
+        found.close()
+        stdout = self.eval("find --sorted -name '*.txt' | head -n 1")
+        self.assertEqual(stdout, "./dir1/file1.txt\n")
+
+    def test_find_predicates(self):
+        self.make_search_tree()
+        with open('tree/big.log', 'w') as f:
+            f.write("x" * 3000)
+        old_time = time.time() - 3 * 86400
+        os.utime('tree/a.log', (old_time, old_time))
+        cases = {
+            "find tree -type d": "tree\ntree/build\ntree/src\n"
+                                 "tree/src/sub\n",
+            "find tree -maxdepth 1 -type f": "tree/a.log\ntree/big.log\n",
+            "find tree -mindepth 2 -name '*.log'":
+                "tree/build/d.log\ntree/src/sub/c.log\n",
+            "find tree -size +2k -type f": "tree/big.log\n",
+            "find tree -size -1 -type d -o -mtime +2":
+                "tree/a.log\n",
+            "find tree -newer tree/a.log -name 'b*' -type f":
+                "tree/big.log\ntree/src/b.py\n",
+            "find tree -path 'tree/src/*' ! -name '*.log' -type f":
+                "tree/src/b.py\ntree/src/e.bin\n",
+            "find tree ( -name 'a*' -o -name 'c*' ) -type f":
+                "tree/a.log\ntree/src/sub/c.log\n",
+        }
+        for cmdline, expected in cases.items():
+            with self.subTest(cmdline=cmdline):
+                self.assertEqual(self.eval(cmdline + " --sorted"), expected)
+
+    def test_find_prune(self):
+        self.make_search_tree()
+        stdout = self.eval("find tree -name build -prune -o -name '*.log' "
+                           "-print --sorted")
+        self.assertEqual(stdout, "tree/a.log\ntree/src/sub/c.log\n")
+        stdout = self.eval("find tree -name src -prune --sorted")
+        self.assertEqual(stdout, "tree/src\n")
+
+    def test_find_exec_batched(self):
+        self.make_search_tree()
+        calls = []
+        original_exec = Grep.exec
+
+        def counting_exec(grep, args, *rest):
+            calls.append(args)
+            return original_exec(grep, args, *rest)
+
+        self.find.exec_batch_size = 2
+        Grep.exec = counting_exec
+        try:
+            self.find.exec(["tree", "-name", "*.log", "-exec", "grep",
+                            "TODO", "{}", "+", "--sorted"], self.out,
+                           None, None, None)
+        finally:
+            Grep.exec = original_exec
+        self.assertEqual("".join(self.out), "tree/a.log:TODO a\n"
+                                            "tree/build/d.log:TODO d\n"
+                                            "TODO c\n")
+        self.assertEqual(calls, [["TODO", "tree/a.log", "tree/build/d.log"],
+                                 ["TODO", "tree/src/sub/c.log"]])
+
+    def test_find_exec_each(self):
+        self.make_search_tree()
+        stdout = self.eval("find tree -name '*.py' -exec echo found {}! ';' "
+                           "-print")
+        self.assertEqual(stdout, "found tree/src/b.py!\ntree/src/b.py\n")
+        with self.assertRaises(ValueError):
+            compile_expression(["-exec", "echo", "{}"])
+        with self.assertRaises(ValueError):
+            compile_expression(["-exec", "{}", "+"])
+
+    def test_find_expression_plan(self):
+        expression = compile_expression(["-size", "+1", "-name", "*.py"])
+        self.assertIsInstance(expression.predicate, And)
+        self.assertEqual([type(operand) for operand
+                          in expression.predicate.operands], [Name, Size])
+        self.assertTrue(Path("tree/src/*").may_match_below("tree"))
+        self.assertTrue(Path("tree/src/*").may_match_below("tree/src/sub"))
+        self.assertFalse(Path("tree/src/*").may_match_below("tree/build"))
+        with self.assertRaises(ValueError):
+            compile_expression(["(", "-name", "x"])
+        with self.assertRaises(ValueError):
+            compile_expression(["-type", "q"])
+
     def test_find_no_match(self):
         cmdline = "find . -name 'nonexistent*.txt'"
         stdout = self.eval(cmdline)
@@ -630,6 +1483,143 @@ class TestShell(unittest.TestCase):
         with self.assertRaises(IOError):
             self.find.exec(["/root", "-name", "*.txt"], [], None, None, None)
 
+    def test_sort_external_merge(self):
+        numbers = [f"{(i * 7919) % 5000:04d}" for i in range(5000)]
+        with open('test_sort.txt', 'w') as f:
+            f.write("\n".join(numbers))
+        os.mkdir('sort_tmp')
+        stdout = self.eval("sort -S 4K -T sort_tmp test_sort.txt")
+        self.assertEqual(stdout, "".join(n + "\n" for n in sorted(numbers)))
+        stdout = self.eval("cat test_sort.txt | sort -r -S 2K")
+        self.assertEqual(stdout, "".join(n + "\n" for n in
+                                         sorted(numbers, reverse=True)))
+        self.assertEqual(os.listdir('sort_tmp'), [])
+        os.remove('test_sort.txt')
+
+    def test_sort_runs(self):
+        lines = [str(i % 97) for i in range(3000)]
+        self.assertEqual(list(sort_lines(lines, buffer_size=200)),
+                         sorted(lines))
+        self.assertEqual(list(sort_lines(iter(lines), buffer_size=1 << 20)),
+                         sorted(lines))
+        self.assertEqual(list(sort_lines([])), [])
+        with self.assertRaises(ValueError):
+            Sort().exec(["-S", "12X"], self.out, "a\n", None, None)
+
+    def test_sort_many_runs_stable(self):
+        lines = [f"k {i}" for i in range(40)]
+        key = SortKey([(1, 1)], stable=True)
+        self.assertEqual(list(sort_lines(lines, key=key, buffer_size=1)),
+                         lines)
+        self.assertEqual(list(sort_lines(lines, key=key, unique=True,
+                                         buffer_size=1)), ["k 0"])
+        self.assertEqual(list(sort_lines(lines, key=key, reverse=True,
+                                         buffer_size=1)), lines)
+
+    def test_sort_parallel(self):
+        lines = [f"{(i * 7919) % 1000:03d}é\n" for i in range(3000)]
+        with open('test_sort.txt', 'w') as f:
+            f.writelines(lines)
+        threshold = sorting.PARALLEL_THRESHOLD
+        sorting.PARALLEL_THRESHOLD = 100
+        try:
+            for flags in ("", "-r", "-S 8K"):
+                with self.subTest(flags=flags):
+                    self.assertEqual(
+                        self.eval(f"sort --parallel=3 {flags} test_sort.txt"),
+                        self.eval(f"sort {flags} test_sort.txt"))
+        finally:
+            sorting.PARALLEL_THRESHOLD = threshold
+        self.assertEqual(self.eval("sort --parallel 2 test_sort.txt"),
+                         "".join(sorted(lines)))
+        with self.assertRaises(ValueError):
+            Sort().exec(["--parallel=0"], self.out, "a\n", None, None)
+        os.remove('test_sort.txt')
+
+    def test_sort_keys(self):
+        data = ("b 10 x\nA 9 y\na 10 x\nc -2.5 z\nB 9 w\nd abc v\n")
+        cases = [
+            ("-n -k2", ["c -2.5 z", "d abc v", "A 9 y", "B 9 w", "a 10 x",
+                        "b 10 x"]),
+            ("-k2,2 -n -s", ["c -2.5 z", "d abc v", "A 9 y", "B 9 w",
+                             "b 10 x", "a 10 x"]),
+            ("-rn -k 2,2", ["b 10 x", "a 10 x", "B 9 w", "A 9 y",
+                            "d abc v", "c -2.5 z"]),
+            ("-f", ["a 10 x", "A 9 y", "b 10 x", "B 9 w", "c -2.5 z",
+                    "d abc v"]),
+            ("-k3", ["d abc v", "B 9 w", "a 10 x", "b 10 x", "A 9 y",
+                     "c -2.5 z"]),
+        ]
+        for flags, expected in cases:
+            with self.subTest(flags=flags):
+                out = deque()
+                Sort().exec(flags.split(), out, data, None, None)
+                self.assertEqual("".join(out).splitlines(), expected)
+        out = deque()
+        Sort().exec(["-t", ":", "-n", "-k", "2,2"], out,
+                    "x:3:a\ny:10:b\nz:2:c\n", None, None)
+        self.assertEqual("".join(out), "z:2:c\nx:3:a\ny:10:b\n")
+        for args in (["-k", "0"], ["-k", "2,1"], ["-k", "x"],
+                     ["-t", "::"], ["-k"]):
+            with self.subTest(args=args):
+                with self.assertRaises(ValueError):
+                    Sort().exec(args, deque(), "a\n", None, None)
+
+    def test_sort_numeric_large(self):
+        lines = [f"{(i * 7919) % 2000 - 1000} r{i % 7}" for i in range(3000)]
+        threshold = sorting.NUMPY_THRESHOLD
+        sorting.NUMPY_THRESHOLD = 100
+        try:
+            for reverse in (False, True):
+                for stable in (False, True):
+                    key = SortKey([(1, 1)], numeric=True, stable=stable)
+                    expected = sorted(
+                        lines, reverse=reverse, key=lambda line: (
+                            (float(line.split()[0]),) if stable else
+                            ((float(line.split()[0]),), line)))
+                    with self.subTest(reverse=reverse, stable=stable):
+                        self.assertEqual(
+                            list(sort_lines(list(lines), key=key,
+                                            reverse=reverse)), expected)
+        finally:
+            sorting.NUMPY_THRESHOLD = threshold
+
+    def test_sort_unique(self):
+        lines = [f"{(i * 7919) % 300:03d}" for i in range(3000)]
+        with open('test_sort.txt', 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        expected = "".join(line + "\n" for line in sorted(set(lines)))
+        for flags in ("-u", "-u -S 2K", "-ru -S 2K"):
+            with self.subTest(flags=flags):
+                stdout = self.eval(f"sort {flags} test_sort.txt")
+                self.assertEqual(stdout.splitlines(), sorted(
+                    set(lines), reverse="r" in flags))
+        self.assertEqual(self.eval("cat test_sort.txt | sort -u"), expected)
+        os.remove('test_sort.txt')
+        out = deque()
+        Sort().exec(["-u", "-f", "-k", "2"], out,
+                    "x B\ny a\nz b\nw A\n", None, None)
+        self.assertEqual("".join(out), "y a\nx B\n")
+
+    def test_sort_head(self):
+        lines = [f"{(i * 7919) % 2000} {i % 3}" for i in range(5000)]
+        data = "".join(line + "\n" for line in lines)
+        for options, head in (([], ["--head=10"]),
+                              (["-r"], ["--head", "7"]),
+                              (["-n"], ["--head=5"]),
+                              (["-u", "-n"], ["--head=12"]),
+                              (["-rsn", "-k", "2"], ["--head=4"]),
+                              (["-u", "-k", "2"], ["--head=10"]),
+                              ([], ["--head=0"])):
+            with self.subTest(options=options, head=head):
+                full, top = deque(), deque()
+                Sort().exec(options, full, data, None, None)
+                Sort().exec(options + head, top, data, None, None)
+                count = int(head[-1].split("=")[-1])
+                self.assertEqual(list(top), list(full)[:count])
+        with self.assertRaises(ValueError):
+            Sort().exec(["--head=x"], deque(), "a\n", None, None)
+
     def test_sort_no_input_data(self):
         cmdline = "sort"
         with self.assertRaises(ValueError):
@@ -711,6 +1701,31 @@ class TestShell(unittest.TestCase):
         self.assertEqual(self.out.popleft(), '3 3 12 test_file.txt\n')
         os.remove('test_file.txt')
 
+    def test_word_count_stdin_and_total(self):
+        with open('test_file.txt', 'w') as f:
+            f.write('one two\nthree  four five\n\nsix')
+        self.assertEqual(self.eval("cat test_file.txt | wc"), "3 6 29\n")
+        self.assertEqual(self.eval("wc -w < test_file.txt"), "6\n")
+        self.assertEqual(self.eval("wc -lc test_file.txt dir1/file3.txt"),
+                         "3 29 test_file.txt\n4 16 dir1/file3.txt\n"
+                         "7 45 total\n")
+        os.remove('test_file.txt')
+
+    def test_word_count_blocks(self):
+        text = "  alpha beta\tgamma\n\ndelta  epsilon zeta eta \ntheta"
+        with open('test_file.txt', 'w') as f:
+            f.write(text)
+        expected = (f"{text.count(chr(10))} {len(text.split())} "
+                    f"{len(text)} test_file.txt\n")
+        for block_size in (1, 2, 3, 5, 7, 64):
+            with self.subTest(block_size=block_size):
+                word_count = WordCount()
+                word_count.block_size = block_size
+                word_count.exec(['test_file.txt'], self.out, None, None,
+                                None)
+                self.assertEqual(self.out.popleft(), expected)
+        os.remove('test_file.txt')
+
     def test_word_count_error_while_counting(self):
         with self.assertRaises(IOError):
             self.word_count.exec(['-l', '/root/file.txt'],